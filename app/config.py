@@ -1,5 +1,6 @@
 """Project configuration from .env"""
 
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -14,6 +15,39 @@ class Settings(BaseSettings):
     secret_key: str
     algo: str
     access_token_expire_minutes: int
+    token_claims: bool = False
+    db_async: bool = False
+    db_echo: bool = False
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_pre_ping: bool = True
+    db_pool_recycle: int = 1800
+    db_replica_host: Optional[str] = None
+    db_replica_port: Optional[int] = None
+    db_replica_max_lag: float = 10.0
+    db_replica_lag_interval: float = 5.0
+    read_your_writes_window: float = 5.0
+    query_budgets: bool = False
+    principal_cache_size: int = 10000
+    principal_cache_ttl: float = 60.0
+    task_cache_size: int = 10000
+    task_cache_ttl: float = 300.0
+    cache_invalidation: bool = True
+    event_broker: str = "postgres"
+    event_queue_size: int = 1000
+    event_heartbeat: float = 15.0
+    import_chunk_size: int = 5000
+    import_hash_workers: int = 4
+    hash_workers: int = 2
+    hash_queue_size: int = 64
+    hash_retry_after: int = 1
+    login_ip_rate: float = 60.0
+    login_ip_burst: float = 20.0
+    login_account_rate: float = 6.0
+    login_account_burst: float = 5.0
+    schedule_time_budget: float = 2.0
+    incremental_scheduling: bool = False
+    schedule_chunk_size: int = 1000
 
 
 settings = Settings()
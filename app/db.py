@@ -1,17 +1,407 @@
 """Module for database initialization and working"""
 
+import inspect
+import logging
+import math
+import threading
+import time
+from functools import wraps
+import jwt
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
+from fastapi.security.utils import get_authorization_scheme_param
+from sqlalchemy import event, text, inspect as inspect_db
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.schema import AddConstraint
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlmodel import create_engine, Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
 from app.config import settings as cnf
+from app.logic.cache import recent_writers
+from app.logic.invalidation import notify
+from app.logic.metrics import (REPLICA_LAG, after_cursor_execute, before_cursor_execute,
+                               request_queries)
 
-DB_URL = f"postgresql://{cnf.db_username}:{cnf.db_password}" \
-         f"@{cnf.db_host}:{cnf.db_port}/{cnf.db_name}"
-engine = create_engine(DB_URL, echo=True)
+def _db_url(driver: str, host: str, port: int):
+    return f"{driver}://{cnf.db_username}:{cnf.db_password}@{host}:{port}/{cnf.db_name}"
 
-def get_session():
-    """Return current database session"""
-    with Session(engine) as session:
+DB_URL = _db_url("postgresql", cnf.db_host, cnf.db_port)
+ASYNC_DB_URL = _db_url("postgresql+asyncpg", cnf.db_host, cnf.db_port)
+REPLICA_PORT = cnf.db_replica_port or cnf.db_port
+REPLICA_URL = _db_url("postgresql", cnf.db_replica_host, REPLICA_PORT)
+ASYNC_REPLICA_URL = _db_url("postgresql+asyncpg", cnf.db_replica_host, REPLICA_PORT)
+
+# Reads of a client go to the primary until the time in this cookie,
+# it is set by ReadYourWritesMiddleware after every successful write.
+# Clients without cookies are recognized by the subject of their token.
+READ_PRIMARY_COOKIE = "read_primary_until"
+READ_METHODS = ("GET", "HEAD")
+
+logger = logging.getLogger(__name__)
+
+class PoolStats:
+    """Counters of a connection pool collected from pool events"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def record_wait(self, seconds: float, timeout: bool = False):
+        """Record time spent waiting for a connection"""
+        with self._lock:
+            self.wait_time_total += seconds
+            self.wait_time_max = max(self.wait_time_max, seconds)
+            self.timeouts += timeout
+
+    def on_connect(self, *_):
+        """Pool 'connect' event handler"""
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, *_):
+        """Pool 'checkout' event handler"""
+        with self._lock:
+            self.checkouts += 1
+
+    def report(self, pool):
+        """Current pool state and collected counters"""
+        with self._lock:
+            return {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_time_total": self.wait_time_total,
+                "wait_time_max": self.wait_time_max,
+            }
+
+def _timed_pool(base, stats: PoolStats):
+    """Pool class which records time spent waiting for a free connection"""
+    class TimedPool(base):  # pylint: disable=too-few-public-methods
+        """Pool which records checkout wait time"""
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                stats.record_wait(time.perf_counter() - start, timeout=True)
+                raise
+            stats.record_wait(time.perf_counter() - start)
+            return connection
+    return TimedPool
+
+def _create(create, url, base_pool, stats: PoolStats):
+    new_engine = create(url,
+                        echo=cnf.db_echo,
+                        poolclass=_timed_pool(base_pool, stats),
+                        pool_size=cnf.db_pool_size,
+                        max_overflow=cnf.db_max_overflow,
+                        pool_pre_ping=cnf.db_pool_pre_ping,
+                        pool_recycle=cnf.db_pool_recycle)
+    pool_target = getattr(new_engine, "sync_engine", new_engine)
+    event.listen(pool_target, "connect", stats.on_connect)
+    event.listen(pool_target, "checkout", stats.on_checkout)
+    event.listen(pool_target, "before_cursor_execute", before_cursor_execute)
+    event.listen(pool_target, "after_cursor_execute", after_cursor_execute)
+    return new_engine
+
+pool_stats = {"sync": PoolStats(), "async": PoolStats(),
+              "replica": PoolStats(), "async_replica": PoolStats()}
+engine = _create(create_engine, DB_URL, QueuePool, pool_stats["sync"])
+# pylint: disable-next=invalid-name
+async_engine = (_create(create_async_engine, ASYNC_DB_URL, AsyncAdaptedQueuePool,
+                        pool_stats["async"])
+                if cnf.db_async else None)
+# pylint: disable-next=invalid-name
+replica_engine = (_create(create_engine, REPLICA_URL, QueuePool, pool_stats["replica"])
+                  if cnf.db_replica_host else None)
+# pylint: disable-next=invalid-name
+async_replica_engine = (_create(create_async_engine, ASYNC_REPLICA_URL, AsyncAdaptedQueuePool,
+                                pool_stats["async_replica"])
+                        if cnf.db_replica_host and cnf.db_async else None)
+
+def pool_report():
+    """Statistics of all connection pools"""
+    report = {"sync": pool_stats["sync"].report(engine.pool)}
+    if async_engine is not None:
+        report["async"] = pool_stats["async"].report(async_engine.sync_engine.pool)
+    if replica_engine is not None:
+        report["replica"] = pool_stats["replica"].report(replica_engine.pool)
+    if async_replica_engine is not None:
+        report["async_replica"] = pool_stats["async_replica"].report(
+            async_replica_engine.sync_engine.pool)
+    return report
+
+class ReplicaState:  # pylint: disable=too-few-public-methods
+    """Last measured replay lag of the replica"""
+    def __init__(self):
+        self.lag = 0.0
+
+    def healthy(self):
+        """Whether the replica is close enough to the primary to serve reads"""
+        return self.lag <= cnf.db_replica_max_lag
+
+replica_state = ReplicaState()
+
+def token_subject(connection: HTTPConnection):
+    """Subject of a valid bearer token of the request or None"""
+    scheme, token = get_authorization_scheme_param(connection.headers.get("authorization"))
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, cnf.secret_key, algorithms=[cnf.algo]).get("sub")
+    except jwt.InvalidTokenError:
+        return None
+
+def uses_replica(connection: HTTPConnection):
+    """Whether a request may read from the replica.
+
+    GET requests and WebSockets read from the replica unless the client has
+    written within the read-your-writes window or the replica lags behind.
+    The window is kept in a cookie and, for token clients which do not send
+    cookies, in ``recent_writers`` by token subject.
+    """
+    if connection.scope.get("method", "GET") not in READ_METHODS:
+        return False
+    try:
+        primary_until = float(connection.cookies.get(READ_PRIMARY_COOKIE, 0))
+    except ValueError:
+        primary_until = 0.0
+    if primary_until > time.time() or not replica_state.healthy():
+        return False
+    subject = token_subject(connection)
+    return subject is None or recent_writers.get(subject) is None
+
+def get_sync_session(connection: HTTPConnection):
+    """Return current database session, on the replica for reads"""
+    bind = engine
+    if replica_engine is not None and uses_replica(connection):
+        bind = replica_engine
+    with Session(bind) as session:
+        yield session
+
+async def get_async_session(connection: HTTPConnection):
+    """Return current asyncio database session, on the replica for reads"""
+    bind = async_engine
+    if async_replica_engine is not None and uses_replica(connection):
+        bind = async_replica_engine
+    async with AsyncSession(bind) as session:
         yield session
 
+def read_engine(connection: HTTPConnection):
+    """Sync engine for reads outliving the request session, e.g. streamed responses"""
+    if replica_engine is not None and uses_replica(connection):
+        return replica_engine
+    return engine
+
+get_session = get_async_session if cnf.db_async else get_sync_session
+
+def session_mode(func):
+    """Adapt sync endpoint or dependency to the configured session mode.
+
+    In async mode a function that depends on ``get_session`` becomes a
+    coroutine running the original code through ``AsyncSession.run_sync``,
+    so the request waits on Postgres without holding a threadpool thread.
+    In sync mode the function is returned unchanged.
+    """
+    if not cnf.db_async or inspect.iscoroutinefunction(func):
+        return func
+
+    names = [name for name, param in inspect.signature(func).parameters.items()
+             if getattr(param.default, "dependency", None) is get_session]
+    if not names:
+        return func
+    session_name = names[0]
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        session = kwargs.pop(session_name)
+        return await session.run_sync(
+            lambda sync_session: func(*args, **{session_name: sync_session}, **kwargs))
+
+    return wrapper
+
+class SessionModeRoute(APIRoute):
+    """Route which adapts its endpoint to the configured session mode"""
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, session_mode(endpoint), **kwargs)
+
+async def run_db(session, func):
+    """Run ``func(sync_session)`` from a coroutine endpoint.
+
+    A sync session is used in the threadpool, an async one through
+    ``AsyncSession.run_sync``, so the event loop is never blocked.
+    """
+    if isinstance(session, AsyncSession):
+        return await session.run_sync(func)
+    return await run_in_threadpool(func, session)
+
+def _announce_writer(subject: str):
+    """Tell the other workers to read from the primary for the subject"""
+    # not a statement of the request, it is not counted against its budget
+    request_queries.set(None)
+    try:
+        with engine.begin() as connection:
+            notify(connection, "writer", [subject])
+    except SQLAlchemyError:
+        logger.exception("Unable to announce write of %s", subject)
+
+class ReadYourWritesMiddleware:  # pylint: disable=too-few-public-methods
+    """ASGI middleware which sends reads of a client to the primary after its writes.
+
+    Successful responses to other methods than GET and HEAD set a cookie
+    valid for ``read_your_writes_window`` seconds, so the client reads its
+    own changes even if the replica has not replayed them yet. The token
+    subject of the writer is remembered too and announced to the other
+    workers, so token clients that ignore cookies get the same window.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (replica_engine is None or scope["type"] != "http"
+                or scope["method"] in READ_METHODS):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                subject = token_subject(HTTPConnection(scope))
+                if subject is not None:
+                    recent_writers.set(subject, True)
+                    if cnf.cache_invalidation:
+                        await run_in_threadpool(_announce_writer, subject)
+                window = cnf.read_your_writes_window
+                MutableHeaders(scope=message).append(
+                    "set-cookie", f"{READ_PRIMARY_COOKIE}={time.time() + window:.3f}; "
+                                  f"Max-Age={math.ceil(window)}; Path=/; HttpOnly; "
+                                  f"SameSite=Lax")
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+SQL_REPLICA_LAG = text("""
+SELECT CASE WHEN NOT pg_is_in_recovery()
+              OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+       END
+""")
+
+class ReplicaLagMonitor(threading.Thread):
+    """Thread which measures the replay lag of the replica.
+
+    The lag is exported as a metric, reads go to the primary while it is
+    above ``db_replica_max_lag`` or the replica is unreachable.
+    """
+
+    def __init__(self):
+        super().__init__(name="replica-lag", daemon=True)
+        self._stop_event = threading.Event()
+
+    def measure(self):
+        """Query the replica and update the lag"""
+        try:
+            with replica_engine.connect() as connection:
+                lag = float(connection.execute(SQL_REPLICA_LAG).scalar())
+        except SQLAlchemyError:
+            logger.exception("Unable to measure replica lag")
+            lag = math.inf
+        replica_state.lag = lag
+        REPLICA_LAG.set(lag)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.measure()
+            self._stop_event.wait(cnf.db_replica_lag_interval)
+
+    def stop(self):
+        """Ask the thread to finish"""
+        self._stop_event.set()
+
+def start_replica_monitor():
+    """Start replica lag monitor of this worker"""
+    monitor = ReplicaLagMonitor()
+    monitor.start()
+    return monitor
+
+# Key of the PostgreSQL advisory lock held while the schema is migrated,
+# workers started together wait for the first one.
+MIGRATION_LOCK_KEY = 0x5C4E3A00
+
+SQL_DUPLICATE_ASSIGNMENTS = text("""
+WITH removed AS (
+    DELETE FROM assignment AS a USING assignment AS b
+    WHERE a.task_id = b.task_id AND a.assignment_id > b.assignment_id
+    RETURNING a.assignment_id, a.task_id, a.user_id
+), deltas AS (
+    SELECT removed.user_id, sum(task.estimated_time) AS delta
+    FROM removed JOIN task USING (task_id)
+    GROUP BY removed.user_id
+), corrected AS (
+    UPDATE "user" SET workload = "user".workload - deltas.delta
+    FROM deltas WHERE "user".user_id = deltas.user_id
+)
+SELECT assignment_id FROM removed
+""")
+
+SQL_ORPHAN_ASSIGNMENTS = text("""
+DELETE FROM assignment
+WHERE NOT EXISTS (SELECT FROM task WHERE task.task_id = assignment.task_id)
+   OR NOT EXISTS (SELECT FROM "user" WHERE "user".user_id = assignment.user_id)
+RETURNING assignment_id
+""")
+
+def _remove_invalid_assignments(connection):
+    """Delete assignment rows which the new constraints would reject.
+
+    Duplicate assignments of a task are removed except the first one and
+    the workloads of their users are corrected; assignments of deleted
+    tasks or users are removed. The removed ids are logged.
+    """
+    for problem, statement in (("duplicate", SQL_DUPLICATE_ASSIGNMENTS),
+                               ("orphan", SQL_ORPHAN_ASSIGNMENTS)):
+        removed = connection.execute(statement).scalars().all()
+        if removed:
+            logger.warning("Removed %d %s assignments: %s", len(removed), problem, removed)
+
 def init_database():
-    """Initialize database"""
-    SQLModel.metadata.create_all(engine)
+    """Create tables and bring an existing database up to the current schema.
+
+    All workers run this on startup, so it runs in one transaction under
+    an advisory lock: the first worker migrates, the others wait and find
+    nothing left to do. Rows violating new foreign keys or the unique
+    index of assignments are removed before they are created.
+    """
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"),
+                           {"key": MIGRATION_LOCK_KEY})
+        SQLModel.metadata.create_all(connection)
+        # columns, foreign keys and indexes added to existing tables
+        connection.execute(text('ALTER TABLE "user" ADD COLUMN IF NOT EXISTS '
+                                'token_version integer NOT NULL DEFAULT 0'))
+        inspector = inspect_db(connection)
+        constraints = []
+        indexes = []
+        for table in SQLModel.metadata.sorted_tables:
+            existing = [set(fk["constrained_columns"])
+                        for fk in inspector.get_foreign_keys(table.name)]
+            constraints += [constraint for constraint in table.foreign_key_constraints
+                            if set(constraint.column_keys) not in existing]
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            indexes += [index for index in table.indexes if index.name not in existing]
+        if constraints or any(index.unique for index in indexes):
+            _remove_invalid_assignments(connection)
+        for constraint in constraints:
+            connection.execute(AddConstraint(constraint))
+        for index in indexes:
+            index.create(connection)
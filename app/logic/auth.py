@@ -1,29 +1,61 @@
 """Authentification core functions"""
 
+import inspect
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
 import jwt
 from jwt.exceptions import InvalidTokenError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
-from sqlmodel import Session, select
+from sqlmodel import Session
 from app.config import settings
-from app.db import get_session
+from app.db import get_session, run_db, session_mode
 from app.schemas import schemas
+from .cache import principal_cache
+from .hashing import HashQueueFull, hash_pool, hash_secret, verify_secret
+from .projection import select_fields
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 
+def _hashing_overloaded():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many password checks in progress, retry later",
+        headers={"Retry-After": str(settings.hash_retry_after)},
+    )
+
+
 def get_password_hash(password):
-    """Get password hash"""
-    return pwd_context.hash(password)
+    """Get password hash, computed in the hashing process pool"""
+    try:
+        return hash_pool.run(hash_secret, password)
+    except HashQueueFull as e:
+        raise _hashing_overloaded() from e
 
 
 def verify_password(plain_password, hashed_password):
-    """Check password correctness"""
-    return pwd_context.verify(plain_password, hashed_password)
+    """Check password correctness in the hashing process pool"""
+    try:
+        return hash_pool.run(verify_secret, plain_password, hashed_password)
+    except HashQueueFull as e:
+        raise _hashing_overloaded() from e
+
+
+async def get_password_hash_async(password):
+    """Get password hash without blocking the event loop"""
+    try:
+        return await hash_pool.run_async(hash_secret, password)
+    except HashQueueFull as e:
+        raise _hashing_overloaded() from e
+
+
+async def verify_password_async(plain_password, hashed_password):
+    """Check password correctness without blocking the event loop"""
+    try:
+        return await hash_pool.run_async(verify_secret, plain_password, hashed_password)
+    except HashQueueFull as e:
+        raise _hashing_overloaded() from e
 
 
 def create_access_token(data: dict,
@@ -45,26 +77,101 @@ def create_access_token(data: dict,
     return encoded_jwt
 
 
-def get_current_user(token: Annotated[str, Depends(oauth2_scheme)],
-                     db_session: Session = Depends(get_session)):
-    """Get logined user"""
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _decode_token(token: str):
+    """Verify token signature and return its claims"""
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algo])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except InvalidTokenError as e:
-        raise credentials_exception from e
+        raise _credentials_exception() from e
+    if payload.get("sub") is None:
+        raise _credentials_exception()
+    return payload
+
+
+def token_claims(user: schemas.User):
+    """Claims of an access token for user.
+
+    Besides the subject the token carries user id, role and token version,
+    so read-only endpoints can authenticate without a database query.
+    """
+    return {"sub": user.email, "uid": user.user_id,
+            "role": user.role, "ver": user.token_version}
+
 
-    statement = (select(schemas.User)
-                 .where(schemas.User.email == username))
-    user = db_session.exec(statement).first()
+@session_mode
+def get_current_user(token: Annotated[str, Depends(oauth2_scheme)],
+                     db_session: Session = Depends(get_session)):
+    """Get logined user.
+
+    Only CurrentUser columns are selected, the password hash is never
+    read. Resolved users are cached by token subject, see ``principal_cache``.
+    Tokens issued before the user's token version was bumped are rejected,
+    so endpoints that modify data should depend on this function.
+    """
+    payload = _decode_token(token)
+    username: str = payload["sub"]
 
+    user = principal_cache.get(username)
     if user is None:
-        raise credentials_exception
+        statement = (select_fields(schemas.User, schemas.CurrentUser)
+                     .where(schemas.User.email == username))
+        user = db_session.exec(statement).first()
+
+        if user is None:
+            raise _credentials_exception()
+
+        user = schemas.CurrentUser.model_validate(user)
+        principal_cache.set(username, user)
+
+    if payload.get("ver", user.token_version) != user.token_version:
+        raise _credentials_exception()
     return user
+
+
+def get_user_principal(user: Annotated[schemas.CurrentUser, Depends(get_current_user)]):
+    """Principal resolved from the database, see ``get_current_user``"""
+    return schemas.Principal(user_id=user.user_id, email=user.email,
+                             role=user.role, token_version=user.token_version)
+
+
+def get_claims_principal(token: Annotated[str, Depends(oauth2_scheme)]):
+    """Principal built from token claims without a database query.
+
+    Revocation is not checked here: a revoked token stays valid for reads
+    until it expires.
+    """
+    payload = _decode_token(token)
+    try:
+        return schemas.Principal(user_id=payload["uid"], email=payload["sub"],
+                                 role=payload["role"], token_version=payload["ver"])
+    except (KeyError, ValueError) as e:
+        raise _credentials_exception() from e
+
+
+get_principal = get_claims_principal if settings.token_claims else get_user_principal
+
+
+async def get_token_principal(token: str, session):
+    """Principal of a token passed without the Authorization header, e.g. to a WebSocket.
+
+    The session is released right away, so a long-lived connection
+    does not hold a database connection.
+    """
+    if settings.token_claims:
+        return get_claims_principal(token)
+
+    def resolve(sync_session: Session):
+        try:
+            return get_user_principal(inspect.unwrap(get_current_user)(token, sync_session))
+        finally:
+            sync_session.rollback()
+
+    return await run_db(session, resolve)
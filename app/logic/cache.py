@@ -0,0 +1,124 @@
+"""In-process caches"""
+
+import threading
+import time
+from collections import OrderedDict
+from app.config import settings
+from .invalidation import subscribe
+
+
+class TTLCache:
+    """Bounded thread-safe LRU cache with time-to-live for entries"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        """Return cached value or None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] < time.monotonic():
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        """Store value, the least recently used entries are evicted"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        """Remove entry"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Size and hit/miss counters"""
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class PrincipalCache(TTLCache):
+    """Authenticated users keyed by token subject (email).
+
+    Entries can also be invalidated by user id, e.g. after workload change.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize, ttl)
+        self._subjects = {}
+
+    def set(self, key, value):
+        with self._lock:
+            super().set(key, value)
+            self._subjects[value.user_id] = key
+
+    def invalidate_user(self, user_id: int):
+        """Remove entry of the user"""
+        with self._lock:
+            subject = self._subjects.pop(user_id, None)
+            if subject is not None:
+                self.pop(subject)
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self._subjects.clear()
+
+
+principal_cache = PrincipalCache(settings.principal_cache_size,
+                                 settings.principal_cache_ttl)
+task_cache = TTLCache(settings.task_cache_size, settings.task_cache_ttl)
+# Token subjects which wrote within the read-your-writes window, workers
+# learn about writes in other workers from "writer" notifications
+recent_writers = TTLCache(settings.principal_cache_size, settings.read_your_writes_window)
+
+
+def _evict_user(user_id):
+    if user_id is None:
+        principal_cache.clear()
+    else:
+        principal_cache.invalidate_user(user_id)
+
+
+def _evict_task(task_id):
+    if task_id is None:
+        task_cache.clear()
+    else:
+        task_cache.pop(task_id)
+
+
+def _remember_writer(subject):
+    # a lost message only means reads from the replica, as without the window
+    if subject is not None:
+        recent_writers.set(subject, True)
+
+
+subscribe("user", _evict_user)
+subscribe("task", _evict_task)
+subscribe("writer", _remember_writer)
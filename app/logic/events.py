@@ -0,0 +1,209 @@
+"""Live feed of assignment changes and workload deltas.
+
+Write paths call ``publish`` inside their transaction. With the default
+``postgres`` broker the events are sent with NOTIFY and every worker passes
+them to its stream clients after commit; the ``local`` broker delivers them
+only to clients of the same process, which is enough for a single worker.
+"""
+
+import asyncio
+import json
+import threading
+import orjson
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from app.config import settings
+from .invalidation import ChannelListener
+
+EVENTS_CHANNEL = "assignment_events"
+# NOTIFY payload must be shorter than 8000 bytes
+MAX_PAYLOAD = 7900
+RESYNC = {"type": "resync"}
+HEARTBEAT = {"type": "heartbeat"}
+
+SQL_PUBLISH = text("SELECT pg_notify(:channel, payload) "
+                   "FROM unnest(CAST(:payloads AS text[])) AS payload")
+
+
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def assignment_event(kind: str, assignment_id: int, task_id: int, user_id: int,
+                     role: str, estimated_time: float):
+    """Event of a created or deleted assignment, ``kind`` is created or deleted"""
+    return {"type": f"assignment.{kind}", "assignment_id": assignment_id,
+            "task_id": task_id, "user_id": user_id, "role": role,
+            "estimated_time": estimated_time}
+
+
+def workload_event(user_id: int, role: str, delta: float, workload: float):
+    """Event of a changed user workload"""
+    return {"type": "workload", "user_id": user_id, "role": role,
+            "delta": delta, "workload": workload}
+
+
+def publish(session: Session, events):
+    """Send events to stream clients of all workers when the transaction commits.
+
+    The postgres broker sends all events with one statement.
+    """
+    events = list(events)
+    if not events:
+        return
+    if settings.event_broker == "local":
+        session.info.setdefault("events", []).extend(events)
+        return
+    session.execute(SQL_PUBLISH, {"channel": EVENTS_CHANNEL,
+                                  "payloads": list(_payloads(events))})
+
+
+def _slim(item: dict):
+    """Event reduced to its type and ids, the client refetches the rest"""
+    return {**{key: value for key, value in item.items()
+               if key == "type" or key.endswith("_id")}, "refetch": True}
+
+
+def _payloads(events):
+    """Pack events into JSON arrays of at most MAX_PAYLOAD encoded bytes.
+
+    An event that alone does not fit is sent as ``_slim`` of it.
+    """
+    batch, size = [], 2
+    for item in events:
+        encoded = json.dumps(item)
+        length = len(encoded.encode()) + 1
+        if length + 2 > MAX_PAYLOAD:
+            encoded = json.dumps(_slim(item))
+            length = len(encoded.encode()) + 1
+        if batch and size + length > MAX_PAYLOAD:
+            yield f"[{','.join(batch)}]"
+            batch, size = [], 2
+        batch.append(encoded)
+        size += length
+    if batch:
+        yield f"[{','.join(batch)}]"
+
+
+@event.listens_for(Session, "after_commit")
+def _deliver_local(session: Session):
+    events = session.info.pop("events", None)
+    if events:
+        broker.deliver(events)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_local(session: Session):
+    session.info.pop("events", None)
+
+
+class Subscription:
+    """Queue of events for one stream client, filtered by role and user.
+
+    Events without role or user id, like resync, are delivered to everybody.
+    """
+
+    def __init__(self, loop, queue_size: int, role=None, user_id=None):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.role = role
+        self.user_id = user_id
+
+    def matches(self, message: dict):
+        """Whether the event passes the filters"""
+        return (self.role is None or message.get("role") in (None, self.role)) and \
+               (self.user_id is None or message.get("user_id") in (None, self.user_id))
+
+    def put(self, events):
+        """Queue events, runs in the event loop of the client.
+
+        A client which falls behind loses the queued events and gets
+        a resync event telling it to reload the state.
+        """
+        for message in events:
+            try:
+                self.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                self.queue.put_nowait(RESYNC)
+                if not self.queue.full():
+                    self.queue.put_nowait(message)
+
+
+class EventBroker:
+    """Fan-out of events to stream clients of this worker"""
+
+    def __init__(self, queue_size: int):
+        self._queue_size = queue_size
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, role=None, user_id=None):
+        """Register a client of the running event loop"""
+        subscription = Subscription(asyncio.get_running_loop(), self._queue_size,
+                                    role, user_id)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """Forget a disconnected client"""
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def deliver(self, events):
+        """Pass events to the matching clients, may be called from any thread"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            matching = [message for message in events if subscription.matches(message)]
+            if not matching:
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, matching)
+            except RuntimeError:
+                # the loop of the client is closed
+                self.unsubscribe(subscription)
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+
+broker = EventBroker(settings.event_queue_size)
+
+
+async def listen(role=None, user_id=None, heartbeat: float | None = None):
+    """Yield events for one client, None after ``heartbeat`` seconds of silence"""
+    subscription = broker.subscribe(role, user_id)
+    try:
+        while True:
+            try:
+                yield await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def sse_message(message: dict | None):
+    """Server-Sent Events frame of an event, a comment for heartbeats"""
+    if message is None:
+        return b": heartbeat\n\n"
+    # pylint: disable-next=no-member
+    return b"event: " + message["type"].encode() + b"\ndata: " + orjson.dumps(message) + b"\n\n"
+
+
+def websocket_message(message: dict | None):
+    """WebSocket text frame of an event or a heartbeat"""
+    return orjson.dumps(message or HEARTBEAT).decode()  # pylint: disable=no-member
+
+
+def start_event_listener():
+    """Start the thread passing NOTIFY events to clients of this worker.
+
+    Clients are asked to resync after a reconnection, events sent while
+    the listener was disconnected are lost.
+    """
+    listener = ChannelListener(EVENTS_CHANNEL,
+                               lambda payload: broker.deliver(json.loads(payload)),
+                               on_connect=lambda: broker.deliver([RESYNC]))
+    listener.start()
+    return listener
@@ -0,0 +1,39 @@
+"""Filtering and sorting of task lists"""
+
+from sqlalchemy import exists
+from sqlmodel import col
+from ..schemas import schemas
+
+
+# pylint: disable-next=too-many-arguments
+def filter_tasks(statement, *, needed_role=None, deadline_from=None, deadline_to=None,
+                 priority_min=None, priority_max=None, assigned=None):
+    """Apply filters to a select of tasks, None means no condition.
+
+    Every condition is backed by an index on task or assignment table.
+    """
+    task = schemas.Task
+    if needed_role is not None:
+        statement = statement.where(task.needed_role == needed_role.lower())
+    if deadline_from is not None:
+        statement = statement.where(task.deadline >= deadline_from)
+    if deadline_to is not None:
+        statement = statement.where(task.deadline <= deadline_to)
+    if priority_min is not None:
+        statement = statement.where(task.priority >= priority_min)
+    if priority_max is not None:
+        statement = statement.where(task.priority <= priority_max)
+    if assigned is not None:
+        is_assigned = exists().where(schemas.Assignment.task_id == task.task_id)
+        statement = statement.where(is_assigned if assigned else ~is_assigned)
+    return statement
+
+
+def sort_tasks(statement, sort: schemas.TaskSort):
+    """Order a select of tasks, ties are broken by id"""
+    task = schemas.Task
+    if sort == schemas.TaskSort.DEADLINE:
+        return statement.order_by(task.deadline, task.task_id)
+    if sort == schemas.TaskSort.PRIORITY:
+        return statement.order_by(col(task.priority).desc(), task.task_id)
+    return statement.order_by(task.task_id)
@@ -0,0 +1,125 @@
+"""Password hashing in a dedicated process pool"""
+
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from passlib.context import CryptContext
+from app.config import settings
+from .metrics import HASH_LATENCY, HASH_QUEUE_DEPTH, HASH_REJECTED
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def hash_secret(password: str):
+    """Compute bcrypt hash, runs in a pool process"""
+    return pwd_context.hash(password)
+
+
+def verify_secret(plain_password: str, hashed_password: str):
+    """Check password against bcrypt hash, runs in a pool process"""
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class HashQueueFull(Exception):
+    """Too many hashing jobs are waiting for the pool"""
+
+
+class HashPool:  # pylint: disable=too-many-instance-attributes
+    """Process pool for bcrypt with a bounded number of pending jobs.
+
+    bcrypt is CPU bound, so it runs outside of the API worker: a burst of
+    logins occupies the pool processes instead of the threads serving other
+    endpoints. Jobs over ``queue_size`` are rejected at once with
+    ``HashQueueFull``. With ``workers == 0`` hashing runs in the caller.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.depth = 0
+        self.max_depth = 0
+        self.completed = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _record(self, start: float):
+        latency = time.perf_counter() - start
+        HASH_QUEUE_DEPTH.dec()
+        HASH_LATENCY.observe(latency)
+        with self._lock:
+            self.depth -= 1
+            self.completed += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def _admit(self):
+        with self._lock:
+            if self.depth >= self.queue_size:
+                self.rejected += 1
+                HASH_REJECTED.inc()
+                raise HashQueueFull()
+            self.depth += 1
+            HASH_QUEUE_DEPTH.inc()
+            self.max_depth = max(self.max_depth, self.depth)
+            if self._executor is None and self.workers > 0:
+                # spawn: forking a process with running threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"))
+            return time.perf_counter()
+
+    def submit(self, func, *args):
+        """Schedule job in the pool, raises HashQueueFull if the queue is full"""
+        start = self._admit()
+        if self._executor is None:
+            future = Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                future.set_exception(e)
+            self._record(start)
+            return future
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._record(start)
+            raise
+        future.add_done_callback(lambda _: self._record(start))
+        return future
+
+    def run(self, func, *args):
+        """Run job in the pool and wait for the result"""
+        return self.submit(func, *args).result()
+
+    async def run_async(self, func, *args):
+        """Run job in the pool without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def stats(self):
+        """Queue depth and hashing latency"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "depth": self.depth,
+                "max_depth": self.max_depth,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "latency_total": self.latency_total,
+                "latency_max": self.latency_max,
+            }
+
+    def shutdown(self):
+        """Stop pool processes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+hash_pool = HashPool(settings.hash_workers, settings.hash_queue_size)
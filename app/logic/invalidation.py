@@ -0,0 +1,123 @@
+"""Cross-worker cache invalidation via PostgreSQL LISTEN/NOTIFY.
+
+Write paths call ``notify`` inside their transaction, PostgreSQL delivers
+the message to every worker after commit, and the listener thread of each
+worker calls the handlers registered with ``subscribe``.
+"""
+
+import json
+import logging
+import select
+import threading
+import psycopg2
+from sqlalchemy import text
+from sqlmodel import Session
+from app.config import settings
+
+CHANNEL = "cache_invalidation"
+# NOTIFY payload must be shorter than 8000 bytes
+IDS_PER_MESSAGE = 500
+POLL_TIMEOUT = 5.0
+RECONNECT_DELAY = 1.0
+
+logger = logging.getLogger(__name__)
+_handlers = {}
+
+
+def subscribe(entity: str, handler):
+    """Call handler(entity_id) when entity changes, None id means all entities"""
+    _handlers.setdefault(entity, []).append(handler)
+
+
+def notify(session: Session, entity: str, ids=None):
+    """Send invalidation message, it is delivered when the transaction commits"""
+    ids = None if ids is None else list(ids)
+    chunks = [None] if ids is None else [ids[i:i + IDS_PER_MESSAGE]
+                                         for i in range(0, len(ids), IDS_PER_MESSAGE)]
+    for chunk in chunks:
+        session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                        {"channel": CHANNEL,
+                         "payload": json.dumps({"entity": entity, "ids": chunk})})
+
+
+def dispatch(payload: str):
+    """Call handlers for one message"""
+    message = json.loads(payload)
+    for handler in _handlers.get(message["entity"], []):
+        try:
+            if message["ids"] is None:
+                handler(None)
+            else:
+                for entity_id in message["ids"]:
+                    handler(entity_id)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Cache invalidation handler failed")
+
+
+def invalidate_all():
+    """Call every handler with None id"""
+    for entity in _handlers:
+        dispatch(json.dumps({"entity": entity, "ids": None}))
+
+
+class ChannelListener(threading.Thread):
+    """Thread which passes messages of one NOTIFY channel to ``handle(payload)``.
+
+    ``on_connect`` is called after every connection, messages sent while
+    the listener was disconnected are lost.
+    """
+
+    def __init__(self, channel: str, handle, on_connect=None):
+        super().__init__(name=channel, daemon=True)
+        self._channel = channel
+        self._handle = handle
+        self._on_connect = on_connect
+        self._stop_event = threading.Event()
+
+    def _connect(self):
+        connection = psycopg2.connect(host=settings.db_host,
+                                      port=settings.db_port,
+                                      user=settings.db_username,
+                                      password=settings.db_password,
+                                      dbname=settings.db_name)
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {self._channel}")
+        return connection
+
+    def _listen(self, connection):
+        while not self._stop_event.is_set():
+            if select.select([connection], [], [], POLL_TIMEOUT) == ([], [], []):
+                continue
+            connection.poll()
+            while connection.notifies:
+                self._handle(connection.notifies.pop(0).payload)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                connection = self._connect()
+            except psycopg2.Error:
+                logger.exception("Unable to listen on %s", self._channel)
+                self._stop_event.wait(RECONNECT_DELAY)
+                continue
+
+            if self._on_connect:
+                self._on_connect()
+            try:
+                self._listen(connection)
+            except psycopg2.Error:
+                logger.exception("Listener of %s disconnected", self._channel)
+            finally:
+                connection.close()
+
+    def stop(self):
+        """Ask the thread to finish"""
+        self._stop_event.set()
+
+
+def start_listener():
+    """Start cache invalidation listener thread of this worker"""
+    listener = ChannelListener(CHANNEL, dispatch, on_connect=invalidate_all)
+    listener.start()
+    return listener
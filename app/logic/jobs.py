@@ -0,0 +1,119 @@
+"""Background scheduling jobs"""
+
+from datetime import datetime, timezone
+import shortuuid
+from sqlalchemy import text, update
+from sqlmodel import Session
+from app.db import engine
+from ..schemas import schemas
+from .metrics import request_queries
+from .schedule import ScheduleMode, count_unassigned_tasks, schedule_tasks
+
+# Key of the PostgreSQL advisory lock held while a scheduling run is active.
+# The lock is shared by all worker processes.
+SCHEDULE_LOCK_KEY = 0x5C4ED01E
+
+
+def create_schedule_job(session: Session, mode: ScheduleMode):
+    """Register a new scheduling job"""
+    job = schemas.ScheduleJob(
+        job_id=shortuuid.uuid(),
+        mode=mode.value,
+        status="queued",
+        created_at=datetime.now(timezone.utc)
+    )
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+
+def _finish(session: Session, job: schemas.ScheduleJob, status: str, **fields):
+    job.status = status
+    job.finished_at = datetime.now(timezone.utc)
+    for key, val in fields.items():
+        setattr(job, key, val)
+    session.add(job)
+    session.commit()
+
+
+def _try_lock(connection):
+    """Take the scheduling lock for the connection's database session.
+
+    The lock outlives transactions, the one used to take it is committed
+    so the connection is not left idle in a transaction.
+    """
+    locked = connection.execute(text("SELECT pg_try_advisory_lock(:key)"),
+                                {"key": SCHEDULE_LOCK_KEY}).scalar()
+    connection.commit()
+    return locked
+
+
+def _unlock(connection):
+    connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SCHEDULE_LOCK_KEY})
+    connection.commit()
+
+
+def _fail_stale_jobs(session: Session):
+    """Mark jobs left running by a stopped worker as failed.
+
+    Call it only with the scheduling lock held: then no run is active.
+    """
+    session.execute(update(schemas.ScheduleJob)
+                    .where(schemas.ScheduleJob.status == "running")
+                    .values(status="failed", error="Worker stopped during the run",
+                            finished_at=datetime.now(timezone.utc)))
+    session.commit()
+
+
+def recover_schedule_jobs():
+    """Fail jobs of workers that stopped during a run, called on startup.
+
+    A run active in another worker holds the lock, its job is left alone.
+    """
+    with engine.connect() as connection:
+        if not _try_lock(connection):
+            return
+        try:
+            with Session(connection) as session:
+                _fail_stale_jobs(session)
+        finally:
+            _unlock(connection)
+
+
+def run_schedule_job(job_id: str):
+    """Run a scheduling job unless another run is active in any worker.
+
+    The lock is taken on the connection the run uses, so a run holds
+    a single pooled connection, idle between the chunk commits.
+    """
+    # runs after the response, its queries are not counted for the request
+    request_queries.set(None)
+    with engine.connect() as connection:
+        locked = _try_lock(connection)
+        with Session(connection, expire_on_commit=False) as session:
+            job = session.get(schemas.ScheduleJob, job_id)
+            if not locked:
+                _finish(session, job, "rejected", error="Another scheduling run is active")
+                return
+
+            try:
+                _fail_stale_jobs(session)
+                job.status = "running"
+                job.total = count_unassigned_tasks(session)
+                session.add(job)
+                session.commit()
+
+                def progress(placed: int):
+                    job.placed = placed
+                    session.add(job)
+                    session.commit()
+
+                report = schedule_tasks(session, ScheduleMode(job.mode), progress=progress)
+                _finish(session, job, "done", placed=report.placed,
+                        report=report.model_dump())
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                session.rollback()
+                _finish(session, job, "failed", error=str(e))
+            finally:
+                _unlock(connection)
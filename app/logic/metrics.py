@@ -0,0 +1,187 @@
+"""Prometheus metrics of requests, database queries, scheduler and hashing.
+
+With several worker processes set ``PROMETHEUS_MULTIPROC_DIR`` to an empty
+directory shared by the workers, values are then aggregated over all of
+them when ``/metrics`` is scraped.
+"""
+
+import logging
+import os
+import time
+from contextvars import ContextVar
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Gauge, Histogram, generate_latest, multiprocess)
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds",
+                            "Request latency by route and status",
+                            ["method", "route", "status"])
+REQUEST_QUERIES = Histogram("http_request_db_queries",
+                            "Database queries issued by one request",
+                            ["method", "route"], buckets=QUERY_BUCKETS)
+REQUEST_DB_TIME = Histogram("http_request_db_seconds",
+                            "Time one request spent in database queries",
+                            ["method", "route"])
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds",
+                             "Latency of single database queries")
+REPLICA_LAG = Gauge("db_replica_lag_seconds",
+                    "Replay lag of the read replica, +Inf if it is unreachable",
+                    multiprocess_mode="livemax")
+
+SCHEDULE_RUNS = Counter("schedule_runs_total", "Scheduler runs", ["mode"])
+SCHEDULE_PLACED = Counter("schedule_tasks_placed_total",
+                          "Tasks placed by the scheduler", ["mode"])
+SCHEDULE_USERS_SCANNED = Counter("schedule_users_scanned_total",
+                                 "Users considered by the scheduler", ["mode"])
+SCHEDULE_DURATION = Histogram("schedule_duration_seconds",
+                              "Duration of scheduler runs", ["mode"],
+                              buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+
+HASH_QUEUE_DEPTH = Gauge("password_hash_queue_depth",
+                         "Password hashing jobs pending in the process pool",
+                         multiprocess_mode="livesum")
+HASH_LATENCY = Histogram("password_hash_duration_seconds",
+                         "Password hashing latency including the queue wait")
+HASH_REJECTED = Counter("password_hash_rejected_total",
+                        "Password hashing jobs rejected because the queue is full")
+
+
+class QueryStats:  # pylint: disable=too-few-public-methods
+    """Queries of one request, statements are kept if ``statements`` is a list"""
+
+    def __init__(self, statements=None):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = statements
+
+
+request_queries = ContextVar("request_queries", default=None)
+
+
+def before_cursor_execute(conn, *_):
+    """Engine event handler, remembers the query start time"""
+    conn.info["query_start"] = time.perf_counter()
+
+
+def after_cursor_execute(conn, _cursor, statement, *_):
+    """Engine event handler, times the query and adds it to the request stats"""
+    start = conn.info.pop("query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    DB_QUERY_LATENCY.observe(elapsed)
+    stats = request_queries.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+        if stats.statements is not None:
+            stats.statements.append(statement)
+
+
+def query_budget(limit: int):
+    """Declare the maximum number of SQL statements one call of an endpoint issues.
+
+    Put it under the router decorator. The budget is the worst case with
+    default settings and a cold principal cache; with ``query_budgets``
+    enabled requests over it are logged and collected in ``budget_violations``.
+    """
+    def decorator(func):
+        func.query_budget = limit
+        return func
+    return decorator
+
+
+class BudgetViolation:  # pylint: disable=too-few-public-methods
+    """Request which issued more statements than its route allows"""
+
+    def __init__(self, method: str, path: str, budget: int, statements):
+        self.method = method
+        self.path = path
+        self.budget = budget
+        self.statements = statements
+
+    def __str__(self):
+        lines = [f"{self.method} {self.path}: {len(self.statements)} statements, "
+                 f"budget {self.budget}"]
+        lines += [f"  {i}. {statement}" for i, statement in enumerate(self.statements, 1)]
+        return "\n".join(lines)
+
+
+budget_violations = []
+
+
+def _check_budget(method: str, route, stats: QueryStats):
+    budget = getattr(getattr(route, "endpoint", None), "query_budget", None)
+    if budget is None or stats.count <= budget:
+        return
+    violation = BudgetViolation(method, route.path, budget, stats.statements)
+    budget_violations.append(violation)
+    logger.warning("Query budget exceeded: %s", violation)
+
+
+def record_schedule(report, users: int, seconds: float):
+    """Record a finished scheduler run"""
+    SCHEDULE_RUNS.labels(report.mode).inc()
+    SCHEDULE_PLACED.labels(report.mode).inc(report.placed)
+    SCHEDULE_USERS_SCANNED.labels(report.mode).inc(users)
+    SCHEDULE_DURATION.labels(report.mode).observe(seconds)
+
+
+class MetricsMiddleware:  # pylint: disable=too-few-public-methods
+    """ASGI middleware which records latency and queries of every request.
+
+    Routes are labelled by their path template, so ``/tasks/1`` and
+    ``/tasks/2`` are the same series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = QueryStats([] if settings.query_budgets else None)
+        token = request_queries.set(stats)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            request_queries.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            REQUEST_LATENCY.labels(scope["method"], path, str(status)).observe(elapsed)
+            REQUEST_QUERIES.labels(scope["method"], path).observe(stats.count)
+            REQUEST_DB_TIME.labels(scope["method"], path).observe(stats.seconds)
+            if stats.statements is not None:
+                _check_budget(scope["method"], route, stats)
+
+
+def render_metrics():
+    """Metrics in Prometheus text format, returns (body, content type)"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    """Drop live gauges of this worker on shutdown"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,50 @@
+"""Keyset pagination and NDJSON streaming for list endpoints"""
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+from app.db import read_engine
+
+NDJSON = "application/x-ndjson"
+STREAM_CHUNK = 1000
+
+
+def paginate(statement, key, limit: int | None, after: int | None):
+    """Order statement by key and take rows after the cursor"""
+    if after is not None:
+        statement = statement.where(key > after)
+    statement = statement.order_by(key)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
+def set_next_cursor(response: Response, rows, key: str, limit: int | None):
+    """Put cursor of the next page into X-Next-Cursor header if the page is full"""
+    if limit is not None and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(getattr(rows[-1], key))
+
+
+def wants_ndjson(request: Request):
+    """Check if client asked for NDJSON"""
+    return NDJSON in request.headers.get("accept", "")
+
+
+def stream_ndjson(request: Request, statement, dump, etag: str | None = None):
+    """Stream rows from a server-side cursor, one JSON document per line.
+
+    The response outlives the request session, so rows are read with
+    a session of their own on the engine the request reads from.
+    ``dump`` converts a row to a JSON string. ``etag`` must be read before
+    the stream starts, the rows can then only be newer than it.
+    """
+    bind = read_engine(request)
+
+    def generate():
+        with Session(bind) as session:
+            rows = session.exec(statement.execution_options(yield_per=STREAM_CHUNK))
+            for row in rows:
+                yield dump(row) + "\n"
+
+    return StreamingResponse(generate(), media_type=NDJSON,
+                             headers={"ETag": etag} if etag else None)
@@ -0,0 +1,13 @@
+"""Column projections for read endpoints"""
+
+from sqlmodel import select
+
+
+def select_fields(table, model):
+    """Select only the columns of ``table`` which are fields of ``model``.
+
+    The result rows are plain named tuples: no ORM instances and identity
+    map entries are created, so long lists allocate less. FastAPI validates
+    them into ``model`` by attributes.
+    """
+    return select(*(getattr(table, name) for name in model.model_fields))
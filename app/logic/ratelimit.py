@@ -0,0 +1,56 @@
+"""Token-bucket rate limiting"""
+
+import threading
+import time
+from collections import OrderedDict
+from app.config import settings
+
+
+class TokenBucketLimiter:
+    """Token bucket for every key, kept in a bounded LRU.
+
+    A bucket holds up to ``burst`` tokens and gains ``rate`` tokens per
+    second. Limits are per process, with several workers the effective
+    limit is multiplied by their number.
+    """
+
+    def __init__(self, rate: float, burst: float, maxsize: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.limited = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """Take a token for key.
+
+        Returns 0 if the token was taken, otherwise seconds until
+        the next token is available.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                self.limited += 1
+                wait = (1 - tokens) / self.rate
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def stats(self):
+        """Number of tracked keys and rejected attempts"""
+        with self._lock:
+            return {"keys": len(self._buckets), "limited": self.limited}
+
+
+login_ip_limiter = TokenBucketLimiter(settings.login_ip_rate / 60,
+                                      settings.login_ip_burst)
+login_account_limiter = TokenBucketLimiter(settings.login_account_rate / 60,
+                                           settings.login_account_burst)
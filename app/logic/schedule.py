@@ -1,22 +1,43 @@
 """Task scheduler"""
 
-from sqlmodel import Session, select
+import heapq
+import time
+from dataclasses import dataclass
+from enum import Enum
+import numpy as np
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, col, select
+from app.config import settings
 from ..schemas import schemas
+from .cache import principal_cache
+from .events import RESYNC, assignment_event, publish
+from .invalidation import notify
+from .metrics import record_schedule
+from .versions import bump
+from .workload import apply_workload_deltas, workload_index, workloads_changed
 
-def schedule_tasks(session: Session):
-    """Distribute unassigned tasks between users"""
-    unassigned_tasks = session.exec(select(schemas.Task)
-                                    .outerjoin(schemas.Assignment,
-                                               schemas.Task.task_id == schemas.Assignment.task_id)
-                                    .where(schemas.Assignment.task_id is None)).all()
-    if unassigned_tasks is None or len(unassigned_tasks) == 0:
-        return
 
-    users = session.exec(select(schemas.User)).all()
-    if users is None or len(users) == 0:
-        return
+class ScheduleMode(str, Enum):
+    """Scheduling backend"""
+    GREEDY = "greedy"
+    SQL = "sql"
+    OPTIMIZE = "optimize"
 
-    for task in unassigned_tasks:
+
+EPS = 1e-9
+
+
+def place_linear(tasks, users):
+    """Greedy placement that scans every user for every task.
+
+    Costs O(tasks * users). Kept as the reference implementation
+    for the heap engine and for benchmarks.
+    Returns list of (task_id, user_id) pairs, users' workload is updated in place.
+    """
+    placements = []
+    for task in tasks:
         best_user = None
         min_workload = float("inf")
 
@@ -30,10 +51,411 @@ def schedule_tasks(session: Session):
 
         if best_user:
             best_user.workload += task.estimated_time
-            session.add(schemas.Assignment(
-                user_id = best_user.user_id,
-                task_id = task.task_id
-            ))
+            placements.append((task.task_id, best_user.user_id))
+
+    return placements
+
+
+def place_heap(tasks, users):
+    """Greedy placement with a min-heap on workload for every role.
+
+    Users are grouped by role once, each placement costs O(log users-in-role).
+    Ties are broken by position in ``users``, so the result is the same as
+    in ``place_linear``.
+    Returns list of (task_id, user_id) pairs, users' workload is updated in place.
+    """
+    heaps = {}
+    for index, user in enumerate(users):
+        heaps.setdefault(user.role, []).append((user.workload, index, user))
+    for heap in heaps.values():
+        heapq.heapify(heap)
+
+    placements = []
+    for task in tasks:
+        heap = heaps.get(task.needed_role)
+        if not heap:
+            continue
+
+        _, index, best_user = heap[0]
+        best_user.workload += task.estimated_time
+        heapq.heapreplace(heap, (best_user.workload, index, best_user))
+        placements.append((task.task_id, best_user.user_id))
+
+    return placements
+
+
+def _rebalance(est, owner, loads, deadline):
+    """Move or swap new tasks between the most and the least loaded users.
+
+    For every pair of a task of the most loaded user and a task of the least
+    loaded one (or nothing, for a plain move) the matrix ``delta`` holds the
+    load that would go from the first user to the second. The exchange that
+    brings the pair closest to balance is applied until no exchange helps
+    or the time budget is over.
+    """
+    while time.perf_counter() < deadline:
+        high, low = int(np.argmax(loads)), int(np.argmin(loads))
+        gap = loads[high] - loads[low]
+        high_tasks = np.flatnonzero(owner == high)
+        if gap <= EPS or high_tasks.size == 0:
+            return
+
+        low_tasks = np.flatnonzero(owner == low)
+        delta = est[high_tasks, None] - np.append(est[low_tasks], 0.0)[None, :]
+        score = np.abs(gap - 2 * delta)
+        score[(delta <= EPS) | (delta >= gap - EPS)] = np.inf
+        best = int(np.argmin(score))
+        if not np.isfinite(score.flat[best]):
+            return
+
+        i, j = divmod(best, score.shape[1])
+        owner[high_tasks[i]] = low
+        if j < low_tasks.size:
+            owner[low_tasks[j]] = high
+        loads[high] -= delta[i, j]
+        loads[low] += delta[i, j]
+
+
+def place_optimized(tasks, users, time_budget: float):
+    """Priority- and deadline-aware placement with a time budget.
+
+    Tasks of every role are ordered by priority (highest first), deadline
+    and estimated time (longest first) and placed on the least loaded user,
+    then ``_rebalance`` improves the makespan of the role. Loads and
+    estimated times are kept in NumPy arrays. Tasks that were not reached
+    before the budget ran out stay unassigned for the next run.
+
+    No task-by-user cost matrix is built: users of a role are
+    interchangeable, so the cost of a task on a user is ``est[i] + loads[j]``
+    and its best user is always ``argmin(loads)``; the matrix would only
+    repeat these two vectors. The result is not optimal. Within one priority
+    class the longest-first pass is the LPT rule, at most 4/3 of the optimal
+    makespan for equal starting workloads, but higher priority classes are
+    placed first, so a long low priority task may come late and the bound
+    does not hold for the whole batch. ``_rebalance`` only stops at a local
+    optimum of moves and swaps between the most and the least loaded user.
+    Returns list of (task_id, user_id) pairs, users' workload is updated in place.
+    """
+    deadline = time.perf_counter() + time_budget
+
+    users_by_role = {}
+    for user in users:
+        users_by_role.setdefault(user.role, []).append(user)
+
+    tasks_by_role = {}
+    for task in sorted(tasks, key=lambda t: (-t.priority, t.deadline, -t.estimated_time)):
+        tasks_by_role.setdefault(task.needed_role, []).append(task)
+
+    placements = []
+    for role, role_tasks in tasks_by_role.items():
+        role_users = users_by_role.get(role)
+        if role_users:
+            placements += _place_role(role_tasks, role_users, deadline)
+    return placements
+
+
+def _place_role(tasks, users, deadline):
+    """Place ordered tasks of one role on its users, see ``place_optimized``"""
+    loads = np.array([user.workload for user in users], dtype=float)
+    est = np.array([task.estimated_time for task in tasks], dtype=float)
+    owner = np.full(len(tasks), -1)
+    for i, task_time in enumerate(est):
+        if i % 1024 == 0 and time.perf_counter() > deadline:
+            break
+        j = int(np.argmin(loads))
+        owner[i] = j
+        loads[j] += task_time
+
+    _rebalance(est, owner, loads, deadline)
+
+    for user, load in zip(users, loads):
+        user.workload = float(load)
+    return [(task.task_id, users[j].user_id) for task, j in zip(tasks, owner) if j >= 0]
+
+
+ENGINES = {
+    "linear": place_linear,
+    "heap": place_heap,
+}
+
+
+def _report(session: Session, mode: ScheduleMode, placed: int, solver_time: float):
+    """Collect workload statistics after a scheduling run"""
+    rows = session.exec(select(schemas.User.role,
+                               func.max(schemas.User.workload),
+                               func.min(schemas.User.workload),
+                               func.count())  # pylint: disable=not-callable
+                        .group_by(schemas.User.role)).all()
+    roles = {role: schemas.RoleWorkload(max_workload=max_load, min_workload=min_load,
+                                        users=users)
+             for role, max_load, min_load, users in rows}
+    return schemas.ScheduleReport(
+        mode=mode,
+        placed=placed,
+        makespan=max((r.max_workload for r in roles.values()), default=0.0),
+        roles=roles,
+        solver_time=solver_time
+    )
+
+
+# Water-filling inside PostgreSQL. Every user of a role gets load "slots"
+# workload, workload + step, workload + 2 * step, ... where step is the mean
+# estimated time of the role's unassigned tasks; the k-th task of the role
+# (by id) takes the k-th lowest slot. This is the order in which the greedy
+# heap picks users, so with equal estimated times within a role the result
+# is the greedy one, also for different starting workloads. With unequal
+# times it is an approximation that never moves rows into Python.
+# Slots are generated only up to the mean final load plus two steps, which
+# is always enough for all tasks. Tasks locked by other transactions are
+# skipped and left for the next run.
+SQL_SCHEDULE = text("""
+WITH locked_tasks AS (
+    SELECT t.task_id, t.needed_role, t.estimated_time
+    FROM task t
+    WHERE NOT EXISTS (SELECT 1 FROM assignment a WHERE a.task_id = t.task_id)
+    FOR UPDATE OF t SKIP LOCKED
+),
+free_tasks AS (
+    SELECT task_id, needed_role,
+           row_number() OVER (PARTITION BY needed_role ORDER BY task_id) AS task_rank
+    FROM locked_tasks
+),
+role_steps AS (
+    SELECT needed_role AS role, count(*) AS tasks,
+           coalesce(nullif(avg(estimated_time), 0), 1) AS step
+    FROM locked_tasks
+    GROUP BY needed_role
+),
+role_levels AS (
+    SELECT s.role, s.step,
+           (sum(u.workload) + s.tasks * s.step) / count(*) + 2 * s.step AS level
+    FROM role_steps s
+    JOIN "user" u ON u.role = s.role
+    GROUP BY s.role, s.step, s.tasks
+),
+ranked_slots AS (
+    SELECT u.user_id, u.role,
+           row_number() OVER (PARTITION BY u.role
+                              ORDER BY u.workload + k.k * l.step, u.user_id) AS slot_rank
+    FROM "user" u
+    JOIN role_levels l ON l.role = u.role
+    CROSS JOIN LATERAL generate_series(
+        0, greatest(ceil((l.level - u.workload) / l.step), 0)::int) AS k(k)
+),
+inserted AS (
+    INSERT INTO assignment (task_id, user_id)
+    SELECT f.task_id, r.user_id
+    FROM free_tasks f
+    JOIN ranked_slots r
+      ON r.role = f.needed_role AND r.slot_rank = f.task_rank
+    ON CONFLICT (task_id) DO NOTHING
+    RETURNING task_id, user_id
+),
+updated AS (
+    UPDATE "user" u
+    SET workload = u.workload + d.delta
+    FROM (SELECT i.user_id, sum(t.estimated_time) AS delta, count(*) AS placed
+          FROM inserted i
+          JOIN task t ON t.task_id = i.task_id
+          GROUP BY i.user_id) d
+    WHERE u.user_id = d.user_id
+    RETURNING d.placed
+)
+SELECT coalesce(sum(placed), 0) FROM updated
+""")
+
+
+def schedule_tasks_sql(session: Session):
+    """Distribute unassigned tasks between users inside the database"""
+    start = time.perf_counter()
+    placed = session.execute(SQL_SCHEDULE).scalar_one()
+    bump(session, "assignment")
+    notify(session, "user")
+    # placements are not returned, stream clients reload the state
+    publish(session, [RESYNC])
+    session.commit()
+    workload_index.clear()
+    principal_cache.clear()
+    return _report(session, ScheduleMode.SQL, placed, time.perf_counter() - start)
+
+
+@dataclass(slots=True)
+class UserLoad:
+    """Mutable workload of a user during a scheduling run"""
+    user_id: int
+    role: str
+    workload: float
+
+
+def _unassigned_tasks():
+    """Select unassigned tasks ordered by id, without loading ORM objects"""
+    return (select(schemas.Task.task_id,
+                   schemas.Task.needed_role,
+                   schemas.Task.estimated_time,
+                   schemas.Task.priority,
+                   schemas.Task.deadline)
+            .outerjoin(schemas.Assignment,
+                       schemas.Task.task_id == schemas.Assignment.task_id)
+            .where(col(schemas.Assignment.task_id).is_(None))  # pylint: disable=no-member
+            .order_by(schemas.Task.task_id))
+
+
+def count_unassigned_tasks(session: Session):
+    """Count tasks without assignment"""
+    return session.exec(select(func.count())  # pylint: disable=not-callable
+                        .select_from(_unassigned_tasks().subquery())).one()
+
+
+def _save_placements(session: Session, placements, estimated, users_by_id):
+    """Write one chunk of placements and commit it.
+
+    Tasks assigned concurrently are skipped by ON CONFLICT. Workloads are
+    increased by atomic deltas of the inserted rows only, and in-memory
+    loads are synchronized with the values returned by the database.
+    """
+    inserted = session.execute(insert(schemas.Assignment)
+                               .values([{"task_id": task_id, "user_id": user_id}
+                                        for task_id, user_id in placements])
+                               .on_conflict_do_nothing(index_elements=["task_id"])
+                               .returning(schemas.Assignment.task_id,
+                                          schemas.Assignment.user_id,
+                                          schemas.Assignment.assignment_id)).all()
+    deltas = {}
+    events = []
+    for task_id, user_id, assignment_id in inserted:
+        deltas[user_id] = deltas.get(user_id, 0.0) + estimated[task_id]
+        events.append(assignment_event("created", assignment_id, task_id, user_id,
+                                       users_by_id[user_id].role, estimated[task_id]))
+    changed = apply_workload_deltas(session, deltas, events)
+    bump(session, "assignment")
+    session.commit()
+
+    placed = {(row.task_id, row.user_id) for row in inserted}
+    for task_id, user_id in set(placements).difference(placed):
+        users_by_id[user_id].workload -= estimated[task_id]
+    for user_id, _, workload in changed:
+        users_by_id[user_id].workload = workload
+    workloads_changed(changed)
+    return len(inserted)
+
+
+def schedule_tasks(session: Session, mode: ScheduleMode = ScheduleMode.GREEDY,
+                   chunk_size: int | None = None, progress=None):
+    """Distribute unassigned tasks between users.
+
+    Placements are committed in chunks of ``chunk_size`` (Settings.schedule_chunk_size
+    by default), in greedy mode tasks are also read chunk by chunk, so locks
+    stay short and memory is bounded. ``progress`` is called with the number
+    of placed tasks after every chunk. The run is recorded in metrics.
+    """
+    start = time.perf_counter()
+    report = _schedule_tasks(session, mode, chunk_size, progress)
+    record_schedule(report, sum(role.users for role in report.roles.values()),
+                    time.perf_counter() - start)
+    return report
+
+
+def _schedule_tasks(session: Session, mode: ScheduleMode, chunk_size: int | None, progress):
+    if mode == ScheduleMode.SQL:
+        report = schedule_tasks_sql(session)
+        if progress:
+            progress(report.placed)
+        return report
+
+    chunk_size = chunk_size or settings.schedule_chunk_size
+    users = [UserLoad(*row) for row in
+             session.exec(select(schemas.User.user_id,
+                                 schemas.User.role,
+                                 schemas.User.workload)
+                          .order_by(schemas.User.user_id)).all()]
+    users_by_id = {user.user_id: user for user in users}
+
+    placed = 0
+    solver_time = 0.0
+    if mode == ScheduleMode.OPTIMIZE:
+        tasks = session.exec(_unassigned_tasks()).all()
+        estimated = {task.task_id: task.estimated_time for task in tasks}
+        start = time.perf_counter()
+        placements = place_optimized(tasks, users, settings.schedule_time_budget)
+        solver_time = time.perf_counter() - start
+        for i in range(0, len(placements), chunk_size):
+            placed += _save_placements(session, placements[i:i + chunk_size],
+                                       estimated, users_by_id)
+            if progress:
+                progress(placed)
+    else:
+        last_task_id = 0
+        while True:
+            # rows locked by concurrent writers are skipped, not waited for
+            tasks = session.exec(_unassigned_tasks()
+                                 .where(schemas.Task.task_id > last_task_id)
+                                 .limit(chunk_size)
+                                 .with_for_update(of=schemas.Task, skip_locked=True)).all()
+            if not tasks:
+                break
+            last_task_id = tasks[-1].task_id
+
+            start = time.perf_counter()
+            placements = place_heap(tasks, users)
+            solver_time += time.perf_counter() - start
+            if placements:
+                placed += _save_placements(session, placements,
+                                           {task.task_id: task.estimated_time
+                                            for task in tasks},
+                                           users_by_id)
+            else:
+                session.rollback()
+            if progress:
+                progress(placed)
+
+    return _report(session, mode, placed, solver_time)
+
+
+def place_task(session: Session, task: schemas.Task, attempts: int = 3):
+    """Assign a new task to the least loaded user with the needed role.
+
+    The user row is locked and compared with the index: if another worker
+    has changed the workload, the index is corrected and the choice is made
+    again. Costs O(log users-in-role) instead of a full rescan.
+    If no choice is confirmed within ``attempts``, or the task was assigned
+    or deleted meanwhile, nothing is saved and None is returned; the task is
+    left to the next scheduling run.
+    """
+    for _ in range(attempts):
+        candidate = workload_index.least_loaded(session, task.needed_role)
+        if candidate is None:
+            return None
+
+        user_id, workload = candidate
+        user = session.exec(select(schemas.User)
+                            .where(schemas.User.user_id == user_id)
+                            .with_for_update()).first()
+        if user is None:
+            workload_index.remove(user_id)
+            continue
+        if user.workload == workload and user.role == task.needed_role:
+            break
+        workload_index.update(user.user_id, user.role, user.workload)
+    else:
+        session.rollback()
+        return None
 
-    session.add_all(users)
+    assignment = schemas.Assignment(
+        user_id = user.user_id,
+        task_id = task.task_id
+    )
+    try:
+        session.add(assignment)
+        session.flush()
+    except IntegrityError:
+        # placed by a concurrent scheduling run or deleted meanwhile
+        session.rollback()
+        return None
+    changed = apply_workload_deltas(
+        session, {user.user_id: task.estimated_time},
+        events=[assignment_event("created", assignment.assignment_id, task.task_id,
+                                 user.user_id, user.role, task.estimated_time)])
+    bump(session, "assignment")
     session.commit()
+    workloads_changed(changed)
+    return assignment
@@ -0,0 +1,61 @@
+"""Fast response rendering with orjson and MessagePack negotiation"""
+
+from contextvars import ContextVar
+import msgpack
+import orjson
+from fastapi.responses import ORJSONResponse
+from starlette.datastructures import MutableHeaders
+
+MSGPACK = "application/msgpack"
+
+wants_msgpack = ContextVar("wants_msgpack", default=False)
+
+
+class FastResponse(ORJSONResponse):
+    """Default response class: orjson, or MessagePack if the client accepts it.
+
+    FastAPI has already converted the content to JSON-compatible data, so
+    both encoders get plain dicts, lists, strings and numbers.
+    """
+
+    def __init__(self, *args, **kwargs):
+        if wants_msgpack.get():
+            self.media_type = MSGPACK
+        super().__init__(*args, **kwargs)
+
+    def render(self, content):
+        if self.media_type == MSGPACK:
+            return msgpack.packb(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)  # pylint: disable=no-member
+
+
+class ContentNegotiationMiddleware:  # pylint: disable=too-few-public-methods
+    """ASGI middleware which remembers if the request accepts MessagePack.
+
+    Only an explicit ``application/msgpack`` in Accept switches the format,
+    browsers and clients sending ``*/*`` keep getting JSON. Every response,
+    also 304 and streamed ones, gets ``Vary: Accept``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_vary(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                vary = [value.strip().lower() for value in headers.get("vary", "").split(",")]
+                if "accept" not in vary and "*" not in vary:
+                    headers.add_vary_header("Accept")
+            await send(message)
+
+        accept = dict(scope["headers"]).get(b"accept", b"")
+        token = wants_msgpack.set(MSGPACK.encode() in accept)
+        try:
+            await self.app(scope, receive, send_with_vary)
+        finally:
+            wants_msgpack.reset(token)
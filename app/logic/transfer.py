@@ -0,0 +1,158 @@
+"""Streaming CSV import and export with PostgreSQL COPY"""
+
+import csv
+import io
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlmodel import Session
+from app.config import settings
+from app.db import engine
+from ..schemas import schemas
+
+TASK_COLUMNS = ["description", "deadline", "priority", "estimated_time", "needed_role"]
+USER_COLUMNS = ["email", "password", "first_name", "last_name", "role", "workload"]
+MAX_REPORTED_ERRORS = 100
+EXPORT_QUEUE_SIZE = 16
+
+
+def _read_chunks(upload: UploadFile, chunk_rows: int):
+    """Yield lists of (line, row) from uploaded CSV with header"""
+    reader = csv.DictReader(io.TextIOWrapper(upload.file, encoding="utf-8", newline=""))
+    chunk = []
+    for row in reader:
+        # Empty cells mean default values
+        chunk.append((reader.line_num, {key: val for key, val in row.items() if val != ""}))
+        if len(chunk) == chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _copy_from(cursor, table: str, columns, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(f'COPY "{table}" ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)',
+                       buffer)
+
+
+def _validate_chunk(chunk, validate, errors: list):
+    """Return valid models of a chunk and the number of rejected rows.
+
+    Errors are appended to ``errors`` until it holds MAX_REPORTED_ERRORS.
+    """
+    valid = []
+    rejected = 0
+    for line, row in chunk:
+        try:
+            valid.append(validate(row))
+        except ValidationError as e:
+            rejected += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(schemas.ImportRowError(line=line, detail=str(e)))
+    return valid, rejected
+
+
+# pylint: disable-next=too-many-arguments
+def import_csv(upload: UploadFile, table: str, columns, validate, *, prepare=None, finish=None):
+    """Validate uploaded CSV chunk by chunk and load valid rows with COPY.
+
+    ``validate`` converts a CSV row to a model, ``prepare`` may post-process
+    the list of valid models of a chunk and ``finish`` is called with the
+    session before commit. Everything is loaded in one transaction.
+    """
+    imported = rejected = 0
+    errors = []
+    with Session(engine) as session:
+        connection = session.connection().connection.driver_connection
+        with connection.cursor() as cursor:
+            for chunk in _read_chunks(upload, settings.import_chunk_size):
+                valid, chunk_rejected = _validate_chunk(chunk, validate, errors)
+                rejected += chunk_rejected
+                if not valid:
+                    continue
+                if prepare:
+                    valid = prepare(valid)
+                _copy_from(cursor, table, columns,
+                           ([getattr(model, column) for column in columns] for model in valid))
+                imported += len(valid)
+
+        if finish and imported:
+            finish(session)
+        session.commit()
+    return schemas.ImportReport(imported=imported, rejected=rejected, errors=errors)
+
+
+def validate_task(row: dict):
+    """CSV row to TaskCreate"""
+    task = schemas.TaskCreate.model_validate(row)
+    task.needed_role = task.needed_role.lower()
+    return task
+
+
+def validate_user(row: dict):
+    """CSV row to User with plain password"""
+    return schemas.User.model_validate(row)
+
+
+def hash_passwords(users, hash_function):
+    """Replace plain passwords of a chunk with hashes computed in parallel"""
+    with ThreadPoolExecutor(max_workers=settings.import_hash_workers) as executor:
+        hashes = executor.map(hash_function, [user.password for user in users])
+    for user, password_hash in zip(users, hashes):
+        user.password = password_hash
+    return users
+
+
+def export_csv(query: str, filename: str):
+    """Stream result of COPY (query) TO STDOUT as CSV response.
+
+    COPY runs in a separate thread and hands chunks to the response
+    through a bounded queue, rows are never built in Python.
+    """
+    chunks = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+    cancelled = threading.Event()
+
+    class Writer:  # pylint: disable=too-few-public-methods
+        """File-like object receiving COPY output"""
+        def write(self, data):
+            """Pass chunk to the response, abort COPY if client has gone"""
+            while not cancelled.is_set():
+                try:
+                    chunks.put(data, timeout=1)
+                    return len(data)
+                except queue.Full:
+                    continue
+            raise ConnectionAbortedError("Export cancelled")
+
+    def copy():
+        connection = engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)",
+                                   Writer())
+            chunks.put(None)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            if not cancelled.is_set():
+                chunks.put(e)
+        finally:
+            connection.close()
+
+    def generate():
+        threading.Thread(target=copy, daemon=True).start()
+        try:
+            while (chunk := chunks.get()) is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            cancelled.set()
+
+    return StreamingResponse(generate(), media_type="text/csv",
+                             headers={"Content-Disposition":
+                                      f'attachment; filename="{filename}"'})
@@ -0,0 +1,59 @@
+"""Per-table change counters and conditional GET support"""
+
+from fastapi import Request, Response, status
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, select
+from ..schemas import schemas
+from .pagination import wants_ndjson
+from .serialization import wants_msgpack
+
+
+def bump(session: Session, *tables: str):
+    """Increment change counters of tables inside the write transaction"""
+    statement = insert(schemas.TableVersion).values(
+        [{"table_name": table, "version": 1} for table in sorted(set(tables))])
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[schemas.TableVersion.table_name],
+        set_={"version": schemas.TableVersion.version + 1}))
+
+
+def representation(request: Request):
+    """Name of the negotiated response format, part of the ETag"""
+    if wants_ndjson(request):
+        return "ndjson"
+    return "msgpack" if wants_msgpack.get() else "json"
+
+
+def etag(request: Request, session: Session, *tables: str):
+    """Strong ETag of the current state of tables in the negotiated format.
+
+    Every format has bytes of its own, so its name is part of the tag.
+    """
+    versions = dict(session.exec(select(schemas.TableVersion.table_name,
+                                        schemas.TableVersion.version)
+                                 .where(col(schemas.TableVersion.table_name).in_(tables))).all())
+    return ('"' + ".".join(f"{table}-{versions.get(table, 0)}" for table in tables)
+            + f'/{representation(request)}"')
+
+
+def _matches(if_none_match: str | None, tag: str):
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip().removeprefix("W/")
+                  for candidate in if_none_match.split(",")]
+    return "*" in candidates or tag in candidates
+
+
+def check_not_modified(request: Request, response: Response,
+                       session: Session, *tables: str):
+    """Return 304 response if the client has the current version of tables.
+
+    Otherwise the ETag header is set on ``response`` and None is returned.
+    The version is read before the rows, so a concurrent write can only
+    make the body newer than its ETag, never older.
+    """
+    tag = etag(request, session, *tables)
+    if _matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": tag})
+    response.headers["ETag"] = tag
+    return None
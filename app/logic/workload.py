@@ -0,0 +1,173 @@
+"""Workload accounting"""
+
+import heapq
+import threading
+from sqlalchemy import Float, Integer, column, update, values
+from sqlmodel import Session, col, select
+from ..schemas import schemas
+from .cache import principal_cache
+from .events import publish, workload_event
+from .invalidation import notify, subscribe
+
+
+class WorkloadIndex:
+    """In-memory per-role min-heaps of user workloads.
+
+    Heap entries are (workload, user_id). An entry becomes stale when the
+    workload of its user changes and is dropped lazily when it reaches the
+    top of the heap. The index is loaded from the user table on first use.
+    Users changed by other workers are marked with ``invalidate`` and
+    re-read before the next lookup.
+
+    Queries run outside the lock: in async mode a sync handler yields to the
+    event loop inside them, and another request on the same thread must not
+    block on the lock. Users changed while a query is running are re-read
+    before the next lookup instead of taking the possibly older row.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heaps = {}
+        self._users = {}
+        self._stale = set()
+        self._loaded = False
+        self._generation = 0
+        self._fetches = []
+
+    def _push(self, user_id: int, role: str, workload: float):
+        self._users[user_id] = (role, workload)
+        heapq.heappush(self._heaps.setdefault(role, []), (workload, user_id))
+
+    def _touch(self, user_id: int):
+        for touched in self._fetches:
+            touched.add(user_id)
+
+    @staticmethod
+    def _fetch(session: Session, user_ids=None):
+        statement = select(schemas.User.user_id, schemas.User.role, schemas.User.workload)
+        if user_ids is not None:
+            statement = statement.where(col(schemas.User.user_id).in_(user_ids))
+        return session.exec(statement).all()
+
+    def _install(self, rows):
+        self._heaps = {}
+        self._users = {user_id: (role, workload) for user_id, role, workload in rows}
+        for user_id, (role, workload) in self._users.items():
+            self._heaps.setdefault(role, []).append((workload, user_id))
+        for heap in self._heaps.values():
+            heapq.heapify(heap)
+        self._stale.clear()
+        self._loaded = True
+
+    def _apply(self, user_ids, rows, touched):
+        for user_id in user_ids - touched:
+            self._users.pop(user_id, None)
+        for user_id, role, workload in rows:
+            if user_id not in touched:
+                self._push(user_id, role, workload)
+
+    def _sync(self, session: Session):
+        """Load the index or re-read stale users, the query runs unlocked"""
+        with self._lock:
+            if self._loaded and not self._stale:
+                return
+            user_ids = set(self._stale) if self._loaded else None
+            self._stale.clear()
+            generation = self._generation
+            touched = set()
+            self._fetches.append(touched)
+
+        try:
+            rows = self._fetch(session, user_ids)
+        except Exception:
+            with self._lock:
+                self._fetches.remove(touched)
+                if user_ids:
+                    self._stale |= user_ids
+            raise
+
+        with self._lock:
+            self._fetches.remove(touched)
+            cleared = generation != self._generation
+            if user_ids is None:
+                # serve this lookup, but reload next time if cleared meanwhile
+                self._install(rows)
+                self._loaded = not cleared
+            elif not cleared:
+                self._apply(user_ids, rows, touched)
+            self._stale |= touched
+
+    def update(self, user_id: int, role: str, workload: float):
+        """Record new workload of a user"""
+        with self._lock:
+            self._touch(user_id)
+            if self._loaded:
+                self._push(user_id, role, workload)
+
+    def remove(self, user_id: int):
+        """Forget a user"""
+        with self._lock:
+            self._touch(user_id)
+            self._users.pop(user_id, None)
+
+    def invalidate(self, user_id: int):
+        """Mark user as changed elsewhere, it is re-read before next lookup"""
+        with self._lock:
+            self._touch(user_id)
+            if self._loaded:
+                self._stale.add(user_id)
+
+    def clear(self):
+        """Drop the index, it will be reloaded on next use"""
+        with self._lock:
+            self._loaded = False
+            self._generation += 1
+
+    def least_loaded(self, session: Session, role: str):
+        """Return (user_id, workload) of the least loaded user with role or None"""
+        self._sync(session)
+        with self._lock:
+            heap = self._heaps.get(role, [])
+            while heap:
+                workload, user_id = heap[0]
+                if self._users.get(user_id) == (role, workload):
+                    return user_id, workload
+                heapq.heappop(heap)
+            return None
+
+
+workload_index = WorkloadIndex()
+subscribe("user", lambda user_id: workload_index.clear() if user_id is None
+          else workload_index.invalidate(user_id))
+
+
+def apply_workload_deltas(session: Session, deltas: dict, events=()):
+    """Add deltas to workloads of users with a single UPDATE ... FROM (VALUES ...).
+
+    Workload events are published together with ``events`` of the caller.
+    Returns (user_id, role, workload) rows of the changed users; pass them
+    to ``workloads_changed`` after commit.
+    """
+    if not deltas:
+        publish(session, events)
+        return []
+
+    data = values(column("user_id", Integer), column("delta", Float),
+                  name="deltas").data(list(deltas.items()))
+    statement = (update(schemas.User)
+                 .where(schemas.User.user_id == data.c.user_id)
+                 .values(workload=schemas.User.workload + data.c.delta)
+                 .returning(schemas.User.user_id, schemas.User.role, schemas.User.workload)
+                 .execution_options(synchronize_session=False))
+    rows = session.execute(statement).all()
+    notify(session, "user", [row.user_id for row in rows])
+    publish(session, [*events, *(workload_event(user_id, role, deltas[user_id], workload)
+                                 for user_id, role, workload in rows)])
+    return rows
+
+
+def workloads_changed(rows):
+    """Update local caches after commit of changed workloads"""
+    for user_id, role, workload in rows:
+        workload_index.update(user_id, role, workload)
+        principal_cache.invalidate_user(user_id)
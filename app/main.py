@@ -1,15 +1,35 @@
 """Initialize FastAPI and database"""
 
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from app.config import settings
 from app.routes import (assignment, auth, task, utils)
-from app.db import init_database
+from app.db import (ReadYourWritesMiddleware, init_database, replica_engine,
+                    start_replica_monitor)
+from app.logic.events import start_event_listener
+from app.logic.hashing import hash_pool
+from app.logic.invalidation import start_listener
+from app.logic.jobs import recover_schedule_jobs
+from app.logic.metrics import MetricsMiddleware, mark_process_dead, render_metrics
+from app.logic.serialization import ContentNegotiationMiddleware, FastResponse
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
-    """Initialize database"""
+    """Initialize database, start listeners and replica monitor, stop hashing pool"""
     init_database()
+    recover_schedule_jobs()
+    listeners = []
+    if replica_engine is not None:
+        listeners.append(start_replica_monitor())
+    if settings.cache_invalidation:
+        listeners.append(start_listener())
+    if settings.event_broker == "postgres":
+        listeners.append(start_event_listener())
     yield
+    for listener in listeners:
+        listener.stop()
+    hash_pool.shutdown()
+    mark_process_dead()
 
 app = FastAPI(
     title="Система управления задачами",
@@ -25,9 +45,20 @@ app = FastAPI(
         "url": "https://opensource.org/licenses/MIT",
     },
     # Uncomment if you need to create tables on app start
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastResponse
 )
 
+app.add_middleware(ContentNegotiationMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """Metrics of all workers in Prometheus text format"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
 app.include_router(assignment.router)
 app.include_router(auth.router)
 app.include_router(task.router)
@@ -1,19 +1,36 @@
 """Routes for task assignments"""
 
-from typing import Annotated, List
-from fastapi import APIRouter, status, Depends, HTTPException
+import asyncio
+from typing import Annotated, List, Optional
+from fastapi import (APIRouter, BackgroundTasks, Query, Request, Response, WebSocket, status,
+                     Depends, HTTPException)
+from fastapi.responses import StreamingResponse
+from fastapi.security.utils import get_authorization_scheme_param
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from sqlmodel import Session, select
-from app.db import get_session
+from app.config import settings
+from app.db import get_session, SessionModeRoute
 from ..schemas import schemas
-from ..logic.auth import get_current_user
-from ..logic.schedule import schedule_tasks
+from ..logic.auth import get_current_user, get_principal, get_token_principal
+from ..logic.events import assignment_event, listen, sse_message, websocket_message
+from ..logic.jobs import create_schedule_job, run_schedule_job
+from ..logic.metrics import query_budget
+from ..logic.pagination import paginate, set_next_cursor, stream_ndjson, wants_ndjson
+from ..logic.schedule import ScheduleMode
+from ..logic.transfer import export_csv
+from ..logic.versions import bump, check_not_modified
+from ..logic.workload import apply_workload_deltas, workloads_changed
 
-router = APIRouter(prefix="/assignment", tags=["Назначенные задачи"])
+router = APIRouter(prefix="/assignment", tags=["Назначенные задачи"],
+                   route_class=SessionModeRoute)
 
 @router.post("/", status_code=status.HTTP_201_CREATED,
              response_model=schemas.Assignment)
+@query_budget(9)
 def create_assignment(assignment: schemas.Assignment,
-                      _current_user: Annotated[schemas.User, Depends(get_current_user)],
+                      _current_user: Annotated[schemas.CurrentUser, Depends(get_current_user)],
                       session: Session = Depends(get_session)):
     """Assign task to user"""
     statement = (select(schemas.User)
@@ -49,70 +66,260 @@ def create_assignment(assignment: schemas.Assignment,
 
     try:
         session.add(new_assignment)
-        existing_user.workload += existing_task.estimated_time
-        session.add(existing_user)
-        session.commit()
-        session.refresh(new_assignment)
-        return new_assignment
-    except Exception as e:
+        session.flush()
+    except IntegrityError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Task {assignment.task_id} already assigned"
         ) from e
 
+    # workload + delta in the database, concurrent assignments are not lost
+    changed = apply_workload_deltas(
+        session, {existing_user.user_id: existing_task.estimated_time},
+        events=[assignment_event("created", new_assignment.assignment_id,
+                                 existing_task.task_id, existing_user.user_id,
+                                 existing_user.role, existing_task.estimated_time)])
+    bump(session, "assignment")
+    session.commit()
+    workloads_changed(changed)
+    session.refresh(new_assignment)
+    return new_assignment
+
+EXPAND_DESCRIPTION = "Связанные объекты через запятую: task, user."
+
+
+def _parse_expand(expand: Optional[str]):
+    """Parse ``?expand=task,user`` into a set of AssignmentExpand"""
+    if not expand:
+        return set()
+    try:
+        return {schemas.AssignmentExpand(name.strip()) for name in expand.split(",")}
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Unable to expand {expand}, allowed: task, user."
+        ) from e
+
+
+def _select_assignments(expand: set):
+    """Select assignments with related rows joined in the same query"""
+    return select(schemas.Assignment).options(
+        *(joinedload(getattr(schemas.Assignment, field.value)) for field in expand))
+
+
+def _expanded(assignment: schemas.Assignment, expand: set):
+    """Assignment with embedded related rows"""
+    return schemas.AssignmentRead(
+        assignment_id=assignment.assignment_id,
+        task_id=assignment.task_id,
+        user_id=assignment.user_id,
+        task=(schemas.TaskRead.model_validate(assignment.task, from_attributes=True)
+              if schemas.AssignmentExpand.TASK in expand else None),
+        user=(schemas.UserPublic.model_validate(assignment.user)
+              if schemas.AssignmentExpand.USER in expand else None)
+    )
+
+
+def _versioned_tables(expand: set):
+    # workloads of users change together with tasks and assignments
+    return ("assignment", "task") if expand else ("assignment",)
+
+
 @router.get("/", status_code=status.HTTP_200_OK,
-            response_model=List[schemas.Assignment])
-def read_assignments(_current_user: Annotated[schemas.User, Depends(get_current_user)],
+            response_model=List[schemas.AssignmentRead],
+            response_model_exclude_none=True)
+@query_budget(3)
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def read_assignments(_current_user: Annotated[schemas.Principal, Depends(get_principal)],
+                     request: Request, response: Response,
+                     limit: Optional[int] = Query(None, gt=0),
+                     after: Optional[int] = None,
+                     expand: Optional[str] = Query(None, description=EXPAND_DESCRIPTION),
                      session: Session = Depends(get_session)):
-    """Get all assignments"""
-    assignments = session.exec(select(schemas.Assignment)).all()
+    """Get assignments ordered by id.
+
+    Supports keyset pagination and NDJSON streaming, see ``read_tasks``.
+    Related tasks and users requested by ``expand`` are loaded by the same
+    query with JOINs.
+    """
+    expand = _parse_expand(expand)
+    not_modified = check_not_modified(request, response, session,
+                                      *_versioned_tables(expand))
+    if not_modified:
+        return not_modified
+
+    statement = paginate(_select_assignments(expand),
+                         schemas.Assignment.assignment_id, limit, after)
+    if wants_ndjson(request):
+        return stream_ndjson(request, statement, lambda assignment: _expanded(assignment, expand)
+                             .model_dump_json(exclude_none=True),
+                             etag=response.headers["ETag"])
+
+    assignments = session.exec(statement).all()
     if assignments is None or len(assignments) == 0:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail="The assignment list is empty."
         )
-    return assignments
+    set_next_cursor(response, assignments, "assignment_id", limit)
+    return [_expanded(assignment, expand) for assignment in assignments]
+
+
+@router.get("/export", status_code=status.HTTP_200_OK,
+            response_class=StreamingResponse)
+@query_budget(1)
+def export_assignments(_current_user: Annotated[schemas.Principal, Depends(get_principal)]):
+    """Export all assignments as CSV streamed from COPY"""
+    return export_csv("SELECT assignment_id, task_id, user_id "
+                      "FROM assignment ORDER BY assignment_id",
+                      "assignments.csv")
+
+
+STREAM_ROLE_DESCRIPTION = "Только события пользователей с этой ролью."
+STREAM_USER_DESCRIPTION = "Только события этого пользователя."
+
+
+@router.get("/stream", status_code=status.HTTP_200_OK,
+            response_class=StreamingResponse,
+            summary="Поток изменений назначений (Server-Sent Events)")
+@query_budget(1)
+async def stream_assignments(
+        _current_user: Annotated[schemas.Principal, Depends(get_principal)],
+        role: Optional[str] = Query(None, description=STREAM_ROLE_DESCRIPTION),
+        user_id: Optional[int] = Query(None, description=STREAM_USER_DESCRIPTION)):
+    """Stream assignment created/deleted events and workload deltas.
+
+    Events are sent as they are committed by any worker. After a resync
+    event the client should reload assignments and users, events were lost.
+    An event with ``refetch`` carries only its type and ids, it was too large
+    to pass between workers and the rows should be read again.
+    """
+    async def generate():
+        async for message in listen(role, user_id, settings.event_heartbeat):
+            yield sse_message(message)
+
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache",
+                                      "X-Accel-Buffering": "no"})
+
+
+@router.websocket("/stream")
+async def stream_assignments_websocket(
+        websocket: WebSocket,
+        role: Optional[str] = Query(None, description=STREAM_ROLE_DESCRIPTION),
+        user_id: Optional[int] = Query(None, description=STREAM_USER_DESCRIPTION),
+        token: Optional[str] = Query(None, description="Токен, если нельзя "
+                                                       "передать заголовок Authorization."),
+        session: Session = Depends(get_session)):
+    """The events of ``GET /assignment/stream`` over a WebSocket, one JSON per message"""
+    if token is None:
+        _, token = get_authorization_scheme_param(websocket.headers.get("authorization"))
+    try:
+        await get_token_principal(token, session)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+
+    async def forward():
+        async for message in listen(role, user_id, settings.event_heartbeat):
+            await websocket.send_text(websocket_message(message))
+
+    forwarding = asyncio.create_task(forward())
+    try:
+        # the client sends nothing, wait until it disconnects
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        forwarding.cancel()
 
 
 @router.get("/{assignment_id}", status_code=status.HTTP_200_OK,
-            response_model=schemas.Assignment)
+            response_model=schemas.AssignmentRead,
+            response_model_exclude_none=True)
+@query_budget(3)
 def read_assignment_by_id(assignment_id: int,
-                          _current_user: Annotated[schemas.User, Depends(get_current_user)],
+                          _current_user: Annotated[schemas.Principal, Depends(get_principal)],
+                          request: Request, response: Response,
+                          expand: Optional[str] = Query(None, description=EXPAND_DESCRIPTION),
                           session: Session = Depends(get_session)):
-    """Get assignment by id"""
-    assignment = session.exec(select(schemas.Assignment)
+    """Get assignment by id, see ``read_assignments`` for ``expand``"""
+    expand = _parse_expand(expand)
+    not_modified = check_not_modified(request, response, session,
+                                      *_versioned_tables(expand))
+    if not_modified:
+        return not_modified
+
+    assignment = session.exec(_select_assignments(expand)
                               .where(schemas.Assignment.assignment_id == assignment_id)).first()
     if assignment is None:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail=f"No assignment with {assignment_id} id."
         )
-    return assignment
+    return _expanded(assignment, expand)
 
 @router.delete("/{assignment_id}", status_code=status.HTTP_200_OK)
+@query_budget(6)
 def delete_assignment(assignment_id: int,
-                      _current_user: Annotated[schemas.User, Depends(get_current_user)],
+                      _current_user: Annotated[schemas.CurrentUser, Depends(get_current_user)],
                       session: Session = Depends(get_session)):
-    """Delete assignment"""
-    assignment = session.exec(select(schemas.Assignment)
-                              .where(schemas.Assignment.assignment_id == assignment_id)).first()
-    if assignment is None:
+    """Delete assignment.
+
+    DELETE ... USING task RETURNING hands the row together with the task's
+    estimated time to exactly one of concurrent requests, so the workload
+    is decreased once.
+    """
+    # Core statement: the ORM variant drops columns of USING tables from RETURNING
+    deleted = session.execute(delete(schemas.Assignment.__table__)
+                              .where(schemas.Assignment.assignment_id == assignment_id,
+                                     schemas.Assignment.task_id == schemas.Task.task_id)
+                              .returning(schemas.Assignment.task_id,
+                                         schemas.Assignment.user_id,
+                                         schemas.Task.needed_role,
+                                         schemas.Task.estimated_time)).first()
+    if deleted is None:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail=f"No assignment with {assignment_id} id."
         )
 
-    task = session.exec(select(schemas.Task)
-                        .where(schemas.Task.task_id == assignment.task_id)).first()
-    user = session.exec(select(schemas.User)
-                        .where(schemas.User.user_id == assignment.user_id)).first()
-    user.workload -= task.estimated_time
-    session.add(user)
-    session.delete(assignment)
+    changed = apply_workload_deltas(
+        session, {deleted.user_id: -deleted.estimated_time},
+        events=[assignment_event("deleted", assignment_id, deleted.task_id, deleted.user_id,
+                                 deleted.needed_role, deleted.estimated_time)])
+    bump(session, "assignment")
     session.commit()
+    workloads_changed(changed)
 
-@router.post("/schedule", status_code=status.HTTP_200_OK)
-def distribute_tasks(_current_user: Annotated[schemas.User, Depends(get_current_user)],
+@router.post("/schedule", status_code=status.HTTP_202_ACCEPTED,
+             response_model=schemas.ScheduleJob)
+@query_budget(3)
+def distribute_tasks(_current_user: Annotated[schemas.CurrentUser, Depends(get_current_user)],
+                     background_tasks: BackgroundTasks,
+                     mode: ScheduleMode = ScheduleMode.GREEDY,
                      session: Session = Depends(get_session)):
-    """Distribute unassigned tasks between users"""
-    return schedule_tasks(session)
+    """Start distribution of unassigned tasks between users.
+
+    The run is done in background, its progress and result are available
+    by the returned job id. With incremental scheduling enabled new tasks
+    are placed on creation, so a full rescan is only needed for recovery.
+    """
+    job = create_schedule_job(session, mode)
+    background_tasks.add_task(run_schedule_job, job.job_id)
+    return job
+
+@router.get("/schedule/{job_id}", status_code=status.HTTP_200_OK,
+            response_model=schemas.ScheduleJob)
+@query_budget(2)
+def read_schedule_job(job_id: str,
+                      _current_user: Annotated[schemas.Principal, Depends(get_principal)],
+                      session: Session = Depends(get_session)):
+    """Get progress and result of a scheduling job"""
+    job = session.get(schemas.ScheduleJob, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No scheduling job with {job_id} id."
+        )
+    return job
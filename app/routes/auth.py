@@ -1,55 +1,124 @@
 """Routes for authentication and authorization"""
 
-from typing import Annotated, List
+import math
+from typing import Annotated, List, Optional
 from datetime import timedelta
-from fastapi import APIRouter, status, Depends, HTTPException
+from fastapi import (APIRouter, Query, Request, Response, UploadFile, status,
+                     Depends, HTTPException)
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
 from sqlmodel import Session, select
+from sqlalchemy import update
 from sqlalchemy.exc import IntegrityError
 from psycopg2.errors import UniqueViolation
 from app.config import settings
-from app.db import get_session
+from app.db import get_session, run_db, SessionModeRoute
 from ..schemas import schemas
 from ..logic import auth
-from ..logic.auth import get_current_user
+from ..logic.auth import get_current_user, get_principal
+from ..logic.cache import principal_cache
+from ..logic.invalidation import notify
+from ..logic.metrics import query_budget
+from ..logic.projection import select_fields
+from ..logic.ratelimit import login_account_limiter, login_ip_limiter
+from ..logic.pagination import paginate, set_next_cursor, stream_ndjson, wants_ndjson
+from ..logic.transfer import USER_COLUMNS, hash_passwords, import_csv, validate_user
+from ..logic.workload import workload_index
 
-router = APIRouter(prefix="/auth", tags=["Безопасность"])
+router = APIRouter(prefix="/auth", tags=["Безопасность"],
+                   route_class=SessionModeRoute)
 
 @router.post("/signup", status_code=status.HTTP_201_CREATED,
              response_model=int,
              summary = 'Добавить пользователя')
-def create_user(user: schemas.User,
-                session: Session = Depends(get_session)):
-    """Register new user"""
+@query_budget(3)
+async def create_user(user: schemas.User,
+                      session: Session = Depends(get_session)):
+    """Register new user.
+
+    The password is hashed in the hashing process pool while the event loop
+    keeps serving other requests.
+    """
     new_user = schemas.User(
         first_name=user.first_name,
         last_name=user.last_name,
         role=user.role,
         workload=user.workload,
         email=user.email,
-        password=auth.get_password_hash(user.password)
+        password=await auth.get_password_hash_async(user.password)
     )
+
+    def save(sync_session: Session):
+        try:
+            sync_session.add(new_user)
+            sync_session.flush()
+            notify(sync_session, "user", [new_user.user_id])
+            sync_session.commit()
+            sync_session.refresh(new_user)
+            workload_index.update(new_user.user_id, new_user.role, new_user.workload)
+            return new_user.user_id
+        except IntegrityError as e:
+            assert isinstance(e.orig, UniqueViolation)
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"User with email {user.email} already exists"
+            ) from e
+
+    return await run_db(session, save)
+
+
+@router.post("/import", status_code=status.HTTP_200_OK,
+             response_model=schemas.ImportReport,
+             summary = 'Импортировать пользователей из CSV')
+@query_budget(2)
+def import_users(file: UploadFile,
+                 _current_user: Annotated[schemas.CurrentUser, Depends(get_current_user)]):
+    """Import users from CSV file.
+
+    The file must have a header with email, password, first_name, last_name,
+    role and workload columns. Passwords of every chunk are hashed in
+    parallel before the chunk is loaded with COPY.
+    """
     try:
-        session.add(new_user)
-        session.commit()
-        session.refresh(new_user)
-        return new_user.user_id
-    except IntegrityError as e:
-        assert isinstance(e.orig, UniqueViolation)
+        report = import_csv(file, "user", USER_COLUMNS, validate_user,
+                            prepare=lambda users: hash_passwords(users, auth.get_password_hash),
+                            finish=lambda session: notify(session, "user"))
+    except UniqueViolation as e:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail=f"User with email {user.email} already exists"
+            detail=f"Some users already exist: {e.diag.message_detail}"
         ) from e
+    workload_index.clear()
+    return report
+
+
+def _limit_login_attempts(request: Request, username: str):
+    client = request.client.host if request.client else ""
+    for limiter, key in ((login_ip_limiter, client),
+                         (login_account_limiter, username.lower())):
+        wait = limiter.acquire(key)
+        if wait:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, retry later",
+                headers={"Retry-After": str(math.ceil(wait))}
+            )
 
 
 @router.post("/login", status_code=status.HTTP_200_OK,
              summary = 'Войти в систему')
-def user_login(login_attempt_data: OAuth2PasswordRequestForm = Depends(),
-               db_session: Session = Depends(get_session)):
-    """Login with email and password"""
+@query_budget(1)
+async def user_login(request: Request,
+                     login_attempt_data: OAuth2PasswordRequestForm = Depends(),
+                     db_session: Session = Depends(get_session)):
+    """Login with email and password.
+
+    Attempts are limited by token buckets for the client address and for
+    the account, the password is checked in the hashing process pool.
+    """
+    _limit_login_attempts(request, login_attempt_data.username)
     statement = (select(schemas.User)
                  .where(schemas.User.email == login_attempt_data.username))
-    existing_user = db_session.exec(statement).first()
+    existing_user = await run_db(db_session, lambda s: s.exec(statement).first())
 
     if not existing_user:
         raise HTTPException(
@@ -57,12 +126,12 @@ def user_login(login_attempt_data: OAuth2PasswordRequestForm = Depends(),
             detail=f"User {login_attempt_data.username} not found"
         )
 
-    if auth.verify_password(
+    if await auth.verify_password_async(
             login_attempt_data.password,
             existing_user.password):
         access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
         access_token = auth.create_access_token(
-            data={"sub": login_attempt_data.username},
+            data=auth.token_claims(existing_user),
             expires_delta=access_token_expires
         )
         return {
@@ -75,37 +144,52 @@ def user_login(login_attempt_data: OAuth2PasswordRequestForm = Depends(),
         detail=f"Wrong password for user {login_attempt_data.username}"
     )
 
+@router.post("/revoke", status_code=status.HTTP_204_NO_CONTENT,
+             summary = 'Отозвать все токены пользователя')
+@query_budget(3)
+def revoke_tokens(current_user: Annotated[schemas.CurrentUser, Depends(get_current_user)],
+                  session: Session = Depends(get_session)):
+    """Invalidate all issued tokens of the current user.
+
+    The token version of the user is incremented, tokens with the old
+    version are rejected by endpoints which modify data.
+    """
+    session.execute(update(schemas.User)
+                    .where(schemas.User.user_id == current_user.user_id)
+                    .values(token_version=schemas.User.token_version + 1))
+    notify(session, "user", [current_user.user_id])
+    session.commit()
+    principal_cache.invalidate_user(current_user.user_id)
+
+
 @router.get("/me", status_code=status.HTTP_200_OK,
              summary = 'Получить информацию о себе',
-             response_model=schemas.User)
-def get_me(current_user: Annotated[schemas.User, Depends(get_current_user)]):
+             response_model=schemas.UserPublic)
+@query_budget(1)
+def get_me(current_user: Annotated[schemas.CurrentUser, Depends(get_current_user)]):
     """Get information about current user"""
-    return schemas.User(
-        first_name=current_user.first_name,
-        last_name=current_user.last_name,
-        role=current_user.role,
-        workload=current_user.workload,
-        email=current_user.email,
-        password="",
-        user_id=current_user.user_id
-    )
+    return current_user
 
 @router.get("/", status_code=status.HTTP_200_OK,
              summary = 'Получить информацию о всех пользователях',
-             response_model=List[schemas.User])
-def get_users(_current_user: Annotated[schemas.User, Depends(get_current_user)],
+             response_model=List[schemas.UserPublic])
+@query_budget(2)
+def get_users(_current_user: Annotated[schemas.Principal, Depends(get_principal)],
+              request: Request, response: Response,
+              limit: Optional[int] = Query(None, gt=0),
+              after: Optional[int] = None,
               session: Session = Depends(get_session)):
-    """Get information about all users"""
-    users = session.exec(select(schemas.User)).all()
-    new_users = []
-    for user in users:
-        new_users.append(schemas.User(
-            first_name=user.first_name,
-            last_name=user.last_name,
-            role=user.role,
-            workload=user.workload,
-            email=user.email,
-            password="",
-            user_id=user.user_id
-        ))
-    return new_users
+    """Get information about users ordered by id.
+
+    Supports keyset pagination and NDJSON streaming like the task list.
+    Only UserPublic columns are selected, password hashes are never read.
+    """
+    statement = paginate(select_fields(schemas.User, schemas.UserPublic),
+                         schemas.User.user_id, limit, after)
+    if wants_ndjson(request):
+        return stream_ndjson(request, statement,
+                             lambda user: schemas.UserPublic.model_validate(user).model_dump_json())
+
+    users = session.exec(statement).all()
+    set_next_cursor(response, users, "user_id", limit)
+    return users
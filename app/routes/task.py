@@ -1,19 +1,44 @@
 """CRUD routes for tasks"""
 
-from typing import List
-from fastapi import APIRouter, status, Depends, HTTPException
-from sqlmodel import Session, select
-from app.db import get_session
+from collections import Counter
+from datetime import date
+from typing import Annotated, List, Optional
+from fastapi import (APIRouter, Body, Query, Request, Response, UploadFile, status,
+                     Depends, HTTPException)
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import delete, insert, update
+from sqlmodel import Session, col, select
+from app.config import settings
+from app.db import get_session, SessionModeRoute
 from ..schemas import schemas
+from ..logic.auth import get_current_user, get_principal
+from ..logic.cache import task_cache
+from ..logic.events import assignment_event
+from ..logic.filters import filter_tasks, sort_tasks
+from ..logic.invalidation import notify
+from ..logic.metrics import query_budget
+from ..logic.pagination import paginate, set_next_cursor, stream_ndjson, wants_ndjson
+from ..logic.projection import select_fields
+from ..logic.schedule import place_task
+from ..logic.transfer import TASK_COLUMNS, export_csv, import_csv, validate_task
+from ..logic.versions import bump, check_not_modified
+from ..logic.workload import apply_workload_deltas, workloads_changed
 
-router = APIRouter(prefix="/tasks", tags=["Управление задачами в БД"])
+router = APIRouter(prefix="/tasks", tags=["Управление задачами в БД"],
+                   route_class=SessionModeRoute)
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED,
              response_model=schemas.TaskRead)
+@query_budget(3)
 def create_task(task: schemas.TaskCreate,
                 session: Session = Depends(get_session)):
-    """Create new task"""
+    """Create new task.
+
+    With incremental scheduling enabled the task is assigned at once
+    to the least loaded user with the needed role.
+    """
     new_task = schemas.Task(
         description = task.description,
         deadline = task.deadline,
@@ -22,42 +47,348 @@ def create_task(task: schemas.TaskCreate,
         needed_role = task.needed_role.lower()
     )
     session.add(new_task)
+    bump(session, "task")
     session.commit()
     session.refresh(new_task)
+    if settings.incremental_scheduling:
+        place_task(session, new_task)
     return new_task
 
 
+@router.post("/bulk", status_code=status.HTTP_200_OK,
+             response_model=List[schemas.BulkItemResult])
+@query_budget(2)
+def create_tasks_bulk(items: List[dict],
+                      session: Session = Depends(get_session)):
+    """Create many tasks in one transaction.
+
+    Every item is validated as TaskCreate, valid ones are inserted with
+    multi-row INSERT statements. Invalid items are reported and skipped.
+    """
+    results = []
+    rows = []
+    for index, item in enumerate(items):
+        try:
+            task = schemas.TaskCreate.model_validate(item)
+        except ValidationError as e:
+            results.append(schemas.BulkItemResult(
+                index=index,
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=str(e)
+            ))
+            continue
+        row = task.model_dump()
+        row["needed_role"] = row["needed_role"].lower()
+        rows.append((index, row))
+
+    if rows:
+        task_ids = session.scalars(
+            insert(schemas.Task).returning(schemas.Task.task_id, sort_by_parameter_order=True),
+            [row for _, row in rows]).all()
+        bump(session, "task")
+        session.commit()
+        for (index, row), task_id in zip(rows, task_ids):
+            results.append(schemas.BulkItemResult(
+                index=index,
+                task_id=task_id,
+                status_code=status.HTTP_201_CREATED
+            ))
+            if settings.incremental_scheduling:
+                place_task(session, schemas.Task(task_id=task_id, **row))
+
+    return sorted(results, key=lambda result: result.index)
+
+
+def _validate_update(index: int, task: schemas.Task, data: dict):
+    """Merge update with task, return row for UPDATE or BulkItemResult error"""
+    unknown = [key for key in data if key not in schemas.TaskCreate.model_fields]
+    if unknown:
+        return schemas.BulkItemResult(
+            index=index, task_id=task.task_id,
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}."
+        )
+
+    current = schemas.TaskCreate.model_validate(task, from_attributes=True).model_dump()
+    try:
+        updated = schemas.TaskCreate.model_validate(current | data)
+    except ValidationError as e:
+        return schemas.BulkItemResult(
+            index=index, task_id=task.task_id,
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e)
+        )
+
+    row = updated.model_dump()
+    row["needed_role"] = row["needed_role"].lower()
+    return {"task_id": task.task_id, **row}
+
+
+def _parse_updates(items: List[dict]):
+    """Split bulk update items into (index, task_id, fields) and error results.
+
+    Items are parsed as TaskBulkUpdate; items naming the same task more than
+    once are rejected.
+    """
+    updates = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            parsed = schemas.TaskBulkUpdate.model_validate(item)
+        except ValidationError as e:
+            errors.append(schemas.BulkItemResult(
+                index=index,
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=str(e)
+            ))
+            continue
+        updates.append((index, parsed.task_id, parsed.model_extra))
+
+    repeats = Counter(task_id for _, task_id, _ in updates)
+    errors.extend(schemas.BulkItemResult(
+                      index=index, task_id=task_id,
+                      status_code=status.HTTP_400_BAD_REQUEST,
+                      detail=f"Task {task_id} is updated more than once."
+                  )
+                  for index, task_id, _ in updates if repeats[task_id] > 1)
+    return [item for item in updates if repeats[item[1]] == 1], errors
+
+
+def _assignee_deltas(session: Session, time_deltas: dict):
+    """Workload deltas of users assigned to tasks with changed estimated time"""
+    changed = [task_id for task_id, delta in time_deltas.items() if delta]
+    if not changed:
+        return {}
+    user_deltas = {}
+    for task_id, user_id in session.exec(
+            select(schemas.Assignment.task_id, schemas.Assignment.user_id)
+            .where(col(schemas.Assignment.task_id).in_(changed))).all():
+        user_deltas[user_id] = user_deltas.get(user_id, 0.0) + time_deltas[task_id]
+    return user_deltas
+
+
+@router.patch("/bulk", status_code=status.HTTP_200_OK,
+              response_model=List[schemas.BulkItemResult])
+@query_budget(8)
+def update_tasks_bulk(items: List[dict],
+                      session: Session = Depends(get_session)):
+    """Update many tasks in one transaction.
+
+    Every item holds task_id and the fields to change. Workloads of users
+    with changed assigned tasks are corrected by the estimated time delta.
+    """
+    updates, results = _parse_updates(items)
+    tasks = {task.task_id: task for task in
+             session.exec(select(schemas.Task)
+                          .where(col(schemas.Task.task_id).in_(
+                              [task_id for _, task_id, _ in updates]))).all()}
+
+    rows = []
+    for index, task_id, data in updates:
+        if task_id not in tasks:
+            result = schemas.BulkItemResult(
+                index=index, task_id=task_id,
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No task with {task_id} id."
+            )
+        else:
+            result = _validate_update(index, tasks[task_id], data)
+        if isinstance(result, dict):
+            rows.append(result)
+            result = schemas.BulkItemResult(
+                index=index, task_id=task_id, status_code=status.HTTP_200_OK)
+        results.append(result)
+    results.sort(key=lambda result: result.index)
+
+    if not rows:
+        return results
+
+    time_deltas = {row["task_id"]: row["estimated_time"] - tasks[row["task_id"]].estimated_time
+                   for row in rows}
+    session.execute(update(schemas.Task), rows)
+    changed_users = apply_workload_deltas(session, _assignee_deltas(session, time_deltas))
+    bump(session, "task")
+    notify(session, "task", time_deltas)
+    session.commit()
+    for task_id in time_deltas:
+        task_cache.pop(task_id)
+    workloads_changed(changed_users)
+    return results
+
+
+@router.delete("/bulk", status_code=status.HTTP_200_OK,
+               response_model=List[schemas.BulkItemResult])
+@query_budget(7)
+def delete_tasks_bulk(task_ids: Annotated[List[int], Body()],
+                      session: Session = Depends(get_session)):
+    """Delete many tasks with their assignments in one transaction.
+
+    Workloads of the assignees are decreased with one set-based UPDATE.
+    """
+    # pylint: disable=no-member
+    # Core statement: the ORM variant drops columns of USING tables from RETURNING
+    assignments = session.execute(delete(schemas.Assignment.__table__)
+                                  .where(col(schemas.Assignment.task_id).in_(task_ids),
+                                         schemas.Assignment.task_id == schemas.Task.task_id)
+                                  .returning(schemas.Assignment.assignment_id,
+                                             schemas.Assignment.task_id,
+                                             schemas.Assignment.user_id,
+                                             schemas.Task.needed_role,
+                                             schemas.Task.estimated_time)).all()
+    deltas = {}
+    for assignment in assignments:
+        deltas[assignment.user_id] = (deltas.get(assignment.user_id, 0.0)
+                                      - assignment.estimated_time)
+    changed_users = apply_workload_deltas(
+        session, deltas, events=[assignment_event("deleted", *assignment)
+                                 for assignment in assignments])
+    deleted = set(session.scalars(delete(schemas.Task)
+                                  .where(col(schemas.Task.task_id).in_(task_ids))
+                                  .returning(schemas.Task.task_id)).all())
+    if deleted:
+        bump(session, "task", "assignment")
+        notify(session, "task", deleted)
+    session.commit()
+    for task_id in deleted:
+        task_cache.pop(task_id)
+    workloads_changed(changed_users)
+
+    return [schemas.BulkItemResult(
+                index=index, task_id=task_id,
+                status_code=status.HTTP_200_OK if task_id in deleted
+                else status.HTTP_404_NOT_FOUND)
+            for index, task_id in enumerate(task_ids)]
+
+
+@router.post("/import", status_code=status.HTTP_200_OK,
+             response_model=schemas.ImportReport)
+@query_budget(2)
+def import_tasks(file: UploadFile,
+                 _current_user: Annotated[schemas.CurrentUser, Depends(get_current_user)]):
+    """Import tasks from CSV file.
+
+    The file must have a header with TaskCreate fields. Rows are validated
+    in chunks and loaded with COPY in one transaction, invalid rows are
+    reported and skipped.
+    """
+    return import_csv(file, "task", TASK_COLUMNS, validate_task,
+                      finish=lambda session: bump(session, "task"))
+
+
+@router.get("/export", status_code=status.HTTP_200_OK,
+            response_class=StreamingResponse)
+@query_budget(1)
+def export_tasks(_current_user: Annotated[schemas.Principal, Depends(get_principal)]):
+    """Export all tasks as CSV streamed from COPY"""
+    return export_csv("SELECT task_id, description, deadline, priority, "
+                      "estimated_time, needed_role FROM task ORDER BY task_id",
+                      "tasks.csv")
+
+
 @router.get("/", status_code=status.HTTP_200_OK,
             response_model=List[schemas.TaskRead])
-def read_tasks(session: Session = Depends(get_session)):
-    """Read all tasks"""
-    tasks = session.exec(select(schemas.Task)).all()
+@query_budget(2)
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def read_tasks(request: Request, response: Response,
+               needed_role: Optional[str] = None,
+               deadline_from: Optional[date] = None,
+               deadline_to: Optional[date] = None,
+               priority_min: Optional[int] = Query(None, gt=0, lt=6),
+               priority_max: Optional[int] = Query(None, gt=0, lt=6),
+               assigned: Optional[bool] = Query(
+                   None, description="true - только назначенные задачи, "
+                                     "false - только свободные."),
+               sort: schemas.TaskSort = Query(
+                   schemas.TaskSort.TASK_ID,
+                   description="task_id, deadline (ближайшие первыми) "
+                               "или priority (самые важные первыми)."),
+               limit: Optional[int] = Query(None, gt=0),
+               after: Optional[int] = None,
+               session: Session = Depends(get_session)):
+    """Read tasks, optionally filtered and sorted.
+
+    With ``limit`` a page is returned, the next one starts ``after`` the id
+    from X-Next-Cursor header (only for sorting by id). With
+    ``Accept: application/x-ndjson`` rows are streamed one per line.
+    Only TaskRead columns are selected, rows are not tracked by the session.
+    """
+    not_modified = check_not_modified(request, response, session, "task")
+    if not_modified:
+        return not_modified
+
+    statement = filter_tasks(select_fields(schemas.Task, schemas.TaskRead),
+                             needed_role=needed_role,
+                             deadline_from=deadline_from,
+                             deadline_to=deadline_to,
+                             priority_min=priority_min,
+                             priority_max=priority_max,
+                             assigned=assigned)
+    if sort == schemas.TaskSort.TASK_ID:
+        statement = paginate(statement, schemas.Task.task_id, limit, after)
+    elif after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor pagination is available only for sorting by task_id."
+        )
+    else:
+        statement = sort_tasks(statement, sort).limit(limit)
+    if wants_ndjson(request):
+        return stream_ndjson(request, statement, lambda task: schemas.TaskRead.model_validate(
+            task, from_attributes=True).model_dump_json(), etag=response.headers["ETag"])
+
+    tasks = session.exec(statement).all()
     if tasks is None or len(tasks) == 0:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail="The task list is empty."
         )
+    if sort == schemas.TaskSort.TASK_ID:
+        set_next_cursor(response, tasks, "task_id", limit)
     return tasks
 
 
 @router.get("/{task_id}", status_code=status.HTTP_200_OK,
             response_model=schemas.TaskRead)
-def read_task_by_id(task_id: int,
+@query_budget(2)
+def read_task_by_id(task_id: int, request: Request, response: Response,
                     session: Session = Depends(get_session)):
-    """Read task by id"""
-    task = session.exec(select(schemas.Task).where(schemas.Task.task_id == task_id)).first()
+    """Read task by id.
+
+    Tasks are cached in memory together with the ETag they were read
+    under; an entry is served only while the table version is unchanged,
+    so a late eviction from another worker or a row read from a lagging
+    replica never pairs an old body with a new ETag.
+    """
+    not_modified = check_not_modified(request, response, session, "task")
+    if not_modified:
+        return not_modified
+
+    tag = response.headers["ETag"]
+    cached = task_cache.get(task_id)
+    if cached is not None and cached[0] == tag:
+        return cached[1]
+
+    task = session.exec(select_fields(schemas.Task, schemas.TaskRead)
+                        .where(schemas.Task.task_id == task_id)).first()
     if task is None:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail=f"No task with {task_id} id."
         )
+    task = schemas.TaskRead.model_validate(task, from_attributes=True)
+    task_cache.set(task_id, (tag, task))
     return task
 
 
 @router.patch("/{task_id}", status_code=status.HTTP_200_OK, response_model=schemas.TaskRead)
+@query_budget(9)
 def update_task_by_id(task_id: int, data_for_update: dict,
                       session: Session = Depends(get_session)):
-    """Update task by id"""
+    """Update task by id.
+
+    Like the bulk update, the assignee's workload is corrected by the
+    estimated time delta.
+    """
     task = session.exec(select(schemas.Task).where(schemas.Task.task_id == task_id)).first()
     if task is None:
         raise HTTPException(
@@ -65,6 +396,7 @@ def update_task_by_id(task_id: int, data_for_update: dict,
             detail=f"No task with {task_id} id."
         )
 
+    estimated_time = task.estimated_time
     for key, val in data_for_update.items():
         if not hasattr(task, key):
             raise HTTPException(
@@ -75,7 +407,7 @@ def update_task_by_id(task_id: int, data_for_update: dict,
         setattr(task, key, val)
 
     try:
-        _ = schemas.TaskCreate(
+        updated = schemas.TaskCreate(
             description = task.description,
             deadline = task.deadline,
             priority = task.priority,
@@ -89,26 +421,47 @@ def update_task_by_id(task_id: int, data_for_update: dict,
               ) from e
 
     session.add(task)
+    changed_users = apply_workload_deltas(
+        session, _assignee_deltas(session, {task_id: updated.estimated_time - estimated_time}))
+    bump(session, "task")
+    notify(session, "task", [task_id])
     session.commit()
+    task_cache.pop(task_id)
+    workloads_changed(changed_users)
     session.refresh(task)
     return task
 
 
 @router.delete("/{task_id}", status_code=status.HTTP_200_OK)
+@query_budget(7)
 def delete_task_by_id(task_id: int,
                       session: Session = Depends(get_session)):
-    """Delete task by id"""
-    task = session.exec(select(schemas.Task).where(schemas.Task.task_id == task_id)).first()
+    """Delete task by id.
+
+    The assignment and the task are removed with DELETE ... RETURNING and
+    the assignee's workload is decreased by the task's estimated time.
+    """
+    assignments = session.execute(delete(schemas.Assignment)
+                                  .where(schemas.Assignment.task_id == task_id)
+                                  .returning(schemas.Assignment.assignment_id,
+                                             schemas.Assignment.user_id)).all()
+    task = session.execute(delete(schemas.Task)
+                           .where(schemas.Task.task_id == task_id)
+                           .returning(schemas.Task.needed_role,
+                                      schemas.Task.estimated_time)).first()
     if task is None:
         raise HTTPException(
             status_code=status.HTTP_204_NO_CONTENT,
             detail=f"No task with {task_id} id."
         )
 
-    assignments = session.exec(select(schemas.Assignment)
-                               .where(schemas.Assignment.task_id == task_id)).all()
-    if assignments is not None:
-        for assignment in assignments:
-            session.delete(assignment)
-    session.delete(task)
+    changed_users = apply_workload_deltas(
+        session, {user_id: -task.estimated_time for _, user_id in assignments},
+        events=[assignment_event("deleted", assignment_id, task_id, user_id,
+                                 task.needed_role, task.estimated_time)
+                for assignment_id, user_id in assignments])
+    bump(session, "task", "assignment")
+    notify(session, "task", [task_id])
     session.commit()
+    task_cache.pop(task_id)
+    workloads_changed(changed_users)
@@ -5,11 +5,15 @@ from fastapi import APIRouter, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy import text
 from sqlmodel import Session, select, SQLModel
-from app.db import get_session, engine
-from app.schemas.schemas import User
-from ..logic.auth import get_current_user
+from app.db import get_session, engine, pool_report, SessionModeRoute
+from app.schemas.schemas import Principal
+from ..logic.auth import get_principal
+from ..logic.cache import principal_cache
+from ..logic.hashing import hash_pool
+from ..logic.ratelimit import login_account_limiter, login_ip_limiter
 
-router = APIRouter(prefix="/utils", tags=["Вспомогательные инструменты"])
+router = APIRouter(prefix="/utils", tags=["Вспомогательные инструменты"],
+                   route_class=SessionModeRoute)
 
 @router.get("/test-db", status_code=status.HTTP_200_OK)
 def test_database(session: Session = Depends(get_session)):
@@ -36,6 +40,33 @@ def show_access_token(token: str = Depends(oauth2_scheme)):
 
 @router.get("/me", response_model=int,
             summary = 'Получить ID вошедшего пользователя')
-def read_users_me(current_user: Annotated[User, Depends(get_current_user)]):
+def read_users_me(current_user: Annotated[Principal, Depends(get_principal)]):
     """Get user id"""
     return current_user.user_id
+
+
+@router.get("/db-pool", status_code=status.HTTP_200_OK,
+            summary = 'Получить статистику пула соединений с БД')
+def read_pool_stats(_current_user: Annotated[Principal, Depends(get_principal)]):
+    """Checked-out and idle connections, overflow and checkout wait time"""
+    return pool_report()
+
+
+@router.get("/principal-cache", status_code=status.HTTP_200_OK,
+            summary = 'Получить статистику кэша пользователей')
+def read_principal_cache_stats(_current_user: Annotated[Principal, Depends(get_principal)]):
+    """Size and hit/miss counters of the authenticated users cache"""
+    return principal_cache.stats()
+
+
+@router.get("/hash-pool", status_code=status.HTTP_200_OK,
+            summary = 'Получить статистику пула хеширования паролей')
+def read_hash_pool_stats(_current_user: Annotated[Principal, Depends(get_principal)]):
+    """Queue depth, rejected jobs and hashing latency, login limiter counters"""
+    return {
+        **hash_pool.stats(),
+        "login_limited": {
+            "ip": login_ip_limiter.stats(),
+            "account": login_account_limiter.stats(),
+        },
+    }
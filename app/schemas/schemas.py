@@ -1,11 +1,12 @@
 """SQL models for database and routes"""
 
-from datetime import date, timedelta
-from typing import Optional
-from pydantic import (BaseModel, Field)
+from datetime import date, datetime, timedelta
+from enum import Enum
+from typing import Dict, List, Optional
+from pydantic import (BaseModel, ConfigDict, Field)
 from pydantic_settings import SettingsConfigDict
-from sqlalchemy import UniqueConstraint
-from sqlmodel import SQLModel, Field as SQLField
+from sqlalchemy import JSON, Column, Index, UniqueConstraint
+from sqlmodel import Relationship, SQLModel, Field as SQLField
 
 class TaskCreate(BaseModel):
     """Model for task creation"""
@@ -48,8 +49,20 @@ class TaskRead(TaskCreate):
 
 class Task(SQLModel, TaskRead, table=True):
     """Model for tasks database"""
+    __table_args__ = (
+        Index("ix_task_role_deadline", "needed_role", "deadline"),
+        Index("ix_task_role_priority", "needed_role", "priority"),
+        Index("ix_task_deadline", "deadline"),
+        Index("ix_task_priority", "priority"),
+    )
     task_id: int = SQLField(default=None, nullable=False, primary_key=True)
 
+class TaskSort(str, Enum):
+    """Order of task list"""
+    TASK_ID = "task_id"
+    DEADLINE = "deadline"
+    PRIORITY = "priority"
+
 class User(SQLModel, table=True):
     """Model for users database"""
     __table_args__ = (UniqueConstraint("email"),)
@@ -60,6 +73,7 @@ class User(SQLModel, table=True):
     last_name: str
     role: str
     workload: float
+    token_version: int = SQLField(default=0, sa_column_kwargs={"server_default": "0"})
 
     model_config = SettingsConfigDict(
         json_schema_extra = {
@@ -73,8 +87,107 @@ class User(SQLModel, table=True):
             }
         })
 
+class Principal(BaseModel):
+    """Authenticated user as seen by read-only endpoints"""
+    user_id: int
+    email: str
+    role: str
+    token_version: int = 0
+
 class Assignment(SQLModel, table=True):
     """Model for assignments database"""
+    __table_args__ = (
+        Index("ux_assignment_task_id", "task_id", unique=True),
+        Index("ix_assignment_user_id", "user_id"),
+    )
     assignment_id: int = SQLField(default=None, nullable=False, primary_key=True)
-    task_id: int = SQLField(nullable=False, unique_items=True)
+    task_id: int = SQLField(nullable=False, unique_items=True,
+                            foreign_key="task.task_id", ondelete="CASCADE")
+    user_id: int = SQLField(foreign_key="user.user_id")
+    task: Optional[Task] = Relationship()
+    user: Optional[User] = Relationship()
+
+class UserPublic(BaseModel):
+    """User without password and token version"""
+    model_config = ConfigDict(from_attributes=True)
     user_id: int
+    email: str
+    first_name: str
+    last_name: str
+    role: str
+    workload: float
+
+class CurrentUser(UserPublic):
+    """Authenticated user without password, cached by token subject"""
+    token_version: int = 0
+
+class AssignmentExpand(str, Enum):
+    """Related rows which can be embedded into assignment"""
+    TASK = "task"
+    USER = "user"
+
+class AssignmentRead(BaseModel):
+    """Assignment with optionally embedded task and user"""
+    assignment_id: int
+    task_id: int
+    user_id: int
+    task: Optional[TaskRead] = None
+    user: Optional[UserPublic] = None
+
+class RoleWorkload(BaseModel):
+    """Workload bounds of one role"""
+    max_workload: float
+    min_workload: float
+    users: int = 0
+
+class ScheduleReport(BaseModel):
+    """Result of a scheduling run"""
+    mode: str
+    placed: int = Field(description="Количество распределённых задач.")
+    makespan: float = Field(description="Максимальная загрузка среди всех пользователей.")
+    roles: Dict[str, RoleWorkload]
+    solver_time: float = Field(description="Время работы алгоритма (в секундах).")
+
+class ScheduleJob(SQLModel, table=True):
+    """Model for background scheduling runs"""
+    __tablename__ = "schedule_job"
+    job_id: str = SQLField(primary_key=True)
+    mode: str
+    status: str = Field(description="queued, running, done, failed или rejected.")
+    total: int = 0
+    placed: int = 0
+    report: Optional[dict] = SQLField(default=None, sa_column=Column(JSON))
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+class TableVersion(SQLModel, table=True):
+    """Model for per-table change counters"""
+    __tablename__ = "table_version"
+    table_name: str = SQLField(primary_key=True)
+    version: int = 0
+
+class TaskBulkUpdate(BaseModel):
+    """Item of a bulk task update: task id and the fields to change"""
+    model_config = ConfigDict(extra="allow")
+    task_id: int = Field(strict=True)
+
+class BulkItemResult(BaseModel):
+    """Result of one item of a bulk request"""
+    index: int = Field(description="Номер элемента в запросе.")
+    task_id: Optional[int] = None
+    status_code: int
+    detail: Optional[str] = None
+
+class ImportRowError(BaseModel):
+    """Rejected row of a CSV import"""
+    line: int
+    detail: str
+
+class ImportReport(BaseModel):
+    """Result of a CSV import"""
+    imported: int
+    rejected: int
+    errors: List[ImportRowError] = Field(
+        description="Первые ошибки валидации (не более 100)."
+    )
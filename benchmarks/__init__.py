@@ -0,0 +1,9 @@
+"""Benchmarks of the scheduler, hot paths and HTTP endpoints"""
+
+import json
+
+
+def write_json(path: str, results):
+    """Write benchmark results to a JSON file"""
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
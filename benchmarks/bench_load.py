@@ -0,0 +1,92 @@
+"""HTTP load test for a running server.
+
+Start the server once with DB_ASYNC=false and once with DB_ASYNC=true and
+run the same scenario against both:
+    python -m benchmarks.bench_load --url http://localhost:80 --clients 1000 \
+        --email user@example.com --password qwerty
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+from . import write_json
+
+PATHS = ["/tasks/", "/assignment/", "/utils/me"]
+
+
+async def client_loop(client, headers, requests, latencies, errors):
+    """Issue requests one after another and record their latency"""
+    for i in range(requests):
+        path = PATHS[i % len(PATHS)]
+        start = time.perf_counter()
+        try:
+            response = await client.get(path, headers=headers)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(url: str, clients: int, requests: int, email: str, password: str):
+    """Log in and run all clients concurrently.
+
+    Returns request count, errors, throughput and latency percentiles in ms.
+    """
+    limits = httpx.Limits(max_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        response = await client.post("/auth/login",
+                                     data={"username": email, "password": password})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        latencies, errors = [], []
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, headers, requests, latencies, errors)
+                               for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+
+
+def report(results):
+    """Print load test results"""
+    print(f"requests:   {results['requests']}")
+    print(f"errors:     {results['errors']}")
+    print(f"throughput: {results['throughput']:.1f} req/s")
+    print(f"p50/p95/p99: {results['p50_ms']:.1f} / {results['p95_ms']:.1f} / "
+          f"{results['p99_ms']:.1f} ms")
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:80")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20,
+                        help="requests per client")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.url, args.clients, args.requests,
+                              args.email, args.password))
+    report(results)
+    if args.output:
+        write_json(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
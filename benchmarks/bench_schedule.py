@@ -0,0 +1,68 @@
+"""Compare scheduler engines on synthetic data.
+
+Usage:
+    python -m benchmarks.bench_schedule --tasks 10000 100000 1000000 --users 500
+"""
+
+import argparse
+import random
+import time
+from types import SimpleNamespace
+from app.logic.schedule import ENGINES
+
+ROLES = ["junior", "middle", "senior", "team lead", "manager"]
+
+
+def make_users(count, rng):
+    """Generate users with random roles and zero workload"""
+    return [SimpleNamespace(user_id=user_id,
+                            role=rng.choice(ROLES),
+                            workload=0.0)
+            for user_id in range(1, count + 1)]
+
+
+def make_tasks(count, rng):
+    """Generate tasks with random roles and estimated time"""
+    return [SimpleNamespace(task_id=task_id,
+                            needed_role=rng.choice(ROLES),
+                            estimated_time=float(rng.randint(1, 10)))
+            for task_id in range(1, count + 1)]
+
+
+def run_engine(name, tasks, users):
+    """Run one engine on a copy of users, return (seconds, placements)"""
+    users = [SimpleNamespace(**vars(user)) for user in users]
+    start = time.perf_counter()
+    placements = ENGINES[name](tasks, users)
+    return time.perf_counter() - start, placements
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, nargs="+",
+                        default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    users = make_users(args.users, rng)
+    print(f"{'tasks':>10} {'engine':>8} {'seconds':>10} {'tasks/s':>12}")
+    for count in args.tasks:
+        tasks = make_tasks(count, rng)
+        results = {}
+        for name in args.engines:
+            seconds, placements = run_engine(name, tasks, users)
+            results[name] = placements
+            print(f"{count:>10} {name:>8} {seconds:>10.3f} {count / seconds:>12.0f}")
+
+        reference = next(iter(results.values()))
+        if any(placements != reference for placements in results.values()):
+            raise SystemExit(f"Engines disagree on {count} tasks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compare response encoders on TaskRead lists.
+
+Every encoder gets the same JSON-compatible data that FastAPI produces from
+the response model, so only the final rendering step differs. The time of
+that shared step (validation of rows and conversion to JSON types) is
+reported separately as "pydantic".
+
+Usage:
+    python -m benchmarks.bench_serialization --items 10000 100000
+"""
+
+import argparse
+import random
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+from typing import List
+import msgpack
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from app.logic.serialization import FastResponse
+from app.schemas.schemas import TaskRead
+
+ROLES = ["junior", "middle", "senior", "team lead", "manager"]
+Row = namedtuple("Row", list(TaskRead.model_fields))
+
+ENCODERS = {
+    "json": lambda content: JSONResponse(content).body,
+    "orjson": lambda content: FastResponse(content).body,
+    "msgpack": msgpack.packb,
+}
+
+
+def make_rows(count, rng):
+    """Generate task rows as returned by a column projection"""
+    today = date.today()
+    return [Row(description=f"Task {task_id}",
+                deadline=today + timedelta(days=rng.randint(0, 30)),
+                priority=rng.randint(1, 5),
+                estimated_time=rng.randint(1, 40) / 4,
+                needed_role=rng.choice(ROLES),
+                task_id=task_id)
+            for task_id in range(1, count + 1)]
+
+
+def measure(func, repeat):
+    """Best time of several runs, returns (seconds, result)"""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--encoders", nargs="+", default=list(ENCODERS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    adapter = TypeAdapter(List[TaskRead])
+    print(f"{'items':>8} {'step':>9} {'seconds':>9} {'items/s':>11} {'MB':>7}")
+    for count in args.items:
+        rows = make_rows(count, rng)
+        seconds, content = measure(
+            lambda rows=rows: adapter.dump_python(
+                adapter.validate_python(rows, from_attributes=True), mode="json"),
+            args.repeat)
+        print(f"{count:>8} {'pydantic':>9} {seconds:>9.3f} {count / seconds:>11.0f} {'':>7}")
+        for name in args.encoders:
+            seconds, body = measure(lambda name=name, content=content: ENCODERS[name](content),
+                                    args.repeat)
+            print(f"{count:>8} {name:>9} {seconds:>9.3f} {count / seconds:>11.0f} "
+                  f"{len(body) / 2**20:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
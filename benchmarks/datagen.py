@@ -0,0 +1,81 @@
+"""Seeded synthetic data for benchmarks.
+
+The same seed always produces the same users and tasks, so runs on
+different commits are comparable. Load into the database from the
+environment (db_* settings):
+    python -m benchmarks.datagen --users 100 --tasks-per-role 2000 --seed 0
+"""
+
+import argparse
+import random
+from datetime import date, timedelta
+import faker
+from sqlalchemy import insert
+from sqlmodel import Session
+from app.db import engine, init_database
+from app.logic.hashing import hash_secret
+from app.schemas import schemas
+
+ROLES = ["junior", "middle", "senior", "team lead", "manager"]
+PASSWORD = "benchmark"
+LOGIN_EMAIL = "bench@example.com"
+
+
+def make_users(count: int, seed: int = 0):
+    """User rows with random roles and zero workload, all with PASSWORD.
+
+    The first user has LOGIN_EMAIL, load tests log in as this user.
+    """
+    fake = faker.Faker()
+    fake.seed_instance(seed)
+    password_hash = hash_secret(PASSWORD)
+    users = []
+    for i in range(count):
+        users.append({"email": LOGIN_EMAIL if i == 0 else f"{i}.{fake.email()}",
+                      "password": password_hash,
+                      "first_name": fake.first_name(),
+                      "last_name": fake.last_name(),
+                      "role": ROLES[i % len(ROLES)],
+                      "workload": 0.0})
+    return users
+
+
+def make_tasks(per_role: int, seed: int = 0):
+    """Task rows, ``per_role`` tasks for every role"""
+    fake = faker.Faker()
+    fake.seed_instance(seed)
+    rng = random.Random(seed)
+    today = date.today()
+    return [{"description": fake.sentence(nb_words=6),
+             "deadline": today + timedelta(days=rng.randint(1, 60)),
+             "priority": rng.randint(1, 5),
+             "estimated_time": float(rng.randint(1, 16)),
+             "needed_role": role}
+            for role in ROLES for _ in range(per_role)]
+
+
+def load(users, tasks, batch: int = 10_000):
+    """Insert rows into the database configured by the environment"""
+    init_database()
+    with Session(engine) as session:
+        for table, rows in ((schemas.User, users), (schemas.Task, tasks)):
+            for i in range(0, len(rows), batch):
+                session.execute(insert(table), rows[i:i + batch])
+        session.commit()
+
+
+def main():
+    """Data generator entry point"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tasks-per-role", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    load(make_users(args.users, args.seed), make_tasks(args.tasks_per_role, args.seed))
+    print(f"Loaded {args.users} users and {args.tasks_per_role * len(ROLES)} tasks, "
+          f"log in as {LOGIN_EMAIL} / {PASSWORD}")
+
+
+if __name__ == "__main__":
+    main()
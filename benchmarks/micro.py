@@ -0,0 +1,111 @@
+"""Micro-benchmarks of CPU-bound hot paths, no database needed.
+
+Every benchmark reports the best of ``--repeat`` runs as operations per
+second:
+    python -m benchmarks.micro --output micro.json
+"""
+
+import argparse
+import random
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import List
+from pydantic import TypeAdapter
+from app.logic.auth import create_access_token, get_claims_principal, token_claims
+from app.logic.hashing import hash_secret, verify_secret
+from app.logic.schedule import place_heap, place_optimized
+from app.schemas import schemas
+from . import write_json
+from .bench_serialization import ENCODERS, make_rows
+from .datagen import make_tasks, make_users
+
+
+def best_rate(func, operations: int, repeat: int):
+    """Best operations per second of several runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return operations / best
+
+
+def scheduler_benchmarks(users, tasks, repeat):
+    """Greedy and optimizing placement"""
+    tasks = [SimpleNamespace(task_id=i, **task) for i, task in enumerate(tasks, 1)]
+
+    def fresh_users():
+        return [SimpleNamespace(user_id=i, role=user["role"], workload=0.0)
+                for i, user in enumerate(users, 1)]
+
+    return {
+        "schedule_heap": best_rate(lambda: place_heap(tasks, fresh_users()),
+                                   len(tasks), repeat),
+        "schedule_optimize": best_rate(lambda: place_optimized(tasks, fresh_users(), 0.5),
+                                       len(tasks), repeat),
+    }
+
+
+def auth_benchmarks(repeat):
+    """bcrypt hash and verify, JWT issue and claims decode"""
+    password_hash = hash_secret("benchmark")
+    user = schemas.User(user_id=1, email="bench@example.com", password="",
+                        first_name="", last_name="", role="senior", workload=0.0)
+    token = create_access_token(token_claims(user), timedelta(minutes=5))
+    return {
+        "bcrypt_hash": best_rate(lambda: hash_secret("benchmark"), 1, repeat),
+        "bcrypt_verify": best_rate(lambda: verify_secret("benchmark", password_hash),
+                                   1, repeat),
+        "jwt_encode": best_rate(lambda: [create_access_token(token_claims(user))
+                                         for _ in range(1000)], 1000, repeat),
+        "jwt_decode": best_rate(lambda: [get_claims_principal(token)
+                                         for _ in range(1000)], 1000, repeat),
+    }
+
+
+def serialization_benchmarks(count, repeat):
+    """Pydantic conversion and every response encoder"""
+    rows = make_rows(count, random.Random(0))
+    adapter = TypeAdapter(List[schemas.TaskRead])
+    content = adapter.dump_python(adapter.validate_python(rows, from_attributes=True),
+                                  mode="json")
+    results = {"serialize_pydantic": best_rate(
+        lambda: adapter.dump_python(adapter.validate_python(rows, from_attributes=True),
+                                    mode="json"), count, repeat)}
+    for name, encode in ENCODERS.items():
+        results[f"serialize_{name}"] = best_rate(lambda encode=encode: encode(content),
+                                                 count, repeat)
+    return results
+
+
+def run(users: int, tasks_per_role: int, items: int, repeat: int, seed: int = 0):
+    """Run all micro-benchmarks, returns {name: operations per second}"""
+    return {
+        **scheduler_benchmarks(make_users(users, seed), make_tasks(tasks_per_role, seed),
+                               repeat),
+        **auth_benchmarks(repeat),
+        **serialization_benchmarks(items, repeat),
+    }
+
+
+def main():
+    """Benchmark entry point"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--tasks-per-role", type=int, default=20_000)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    results = run(args.users, args.tasks_per_role, args.items, args.repeat)
+    for name, rate in results.items():
+        print(f"{name:>20} {rate:>14.1f} ops/s")
+    if args.output:
+        write_json(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Benchmark suite: micro-benchmarks and an HTTP load test on a throwaway Postgres.
+
+The load test starts a disposable postgres container (``--postgres docker``)
+or uses the database from the environment (``--postgres env``), seeds it
+with benchmarks.datagen and runs uvicorn against it. Results are written as
+JSON and compared with a stored baseline; the exit code is 1 if any metric
+got worse by more than ``--threshold``:
+    python -m benchmarks.suite --output results.json --baseline benchmarks/baseline.json
+    python -m benchmarks.suite --output benchmarks/baseline.json  # store a new baseline
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from . import micro, write_json
+from .bench_load import run as run_load
+from .datagen import LOGIN_EMAIL, PASSWORD
+
+POSTGRES_IMAGE = "postgres:12.5"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait(check, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return
+        time.sleep(0.5)
+    raise SystemExit(f"{what} did not start in {timeout} s")
+
+
+@contextmanager
+def docker_postgres():
+    """Run a disposable postgres container, yields db_* environment"""
+    port = _free_port()
+    name = f"stm-bench-{uuid.uuid4().hex[:8]}"
+    env = {"db_username": "bench", "db_password": "bench", "db_name": "bench",
+           "db_host": "127.0.0.1", "db_port": str(port)}
+    subprocess.run(["docker", "run", "--rm", "-d", "--name", name, "-p", f"{port}:5432",
+                    "-e", "POSTGRES_USER=bench", "-e", "POSTGRES_PASSWORD=bench",
+                    "-e", "POSTGRES_DB=bench", "--tmpfs", "/var/lib/postgresql/data",
+                    POSTGRES_IMAGE], check=True, stdout=subprocess.DEVNULL)
+    try:
+        _wait(lambda: subprocess.run(["docker", "exec", name, "pg_isready", "-U", "bench",
+                                      "-h", "127.0.0.1"],
+                                     stdout=subprocess.DEVNULL, check=False).returncode == 0,
+              60, "postgres")
+        yield env
+    finally:
+        subprocess.run(["docker", "stop", name], check=False, stdout=subprocess.DEVNULL)
+
+
+@contextmanager
+def server(env, workers: int):
+    """Run uvicorn with the given environment, yields its base URL"""
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app",
+                                "--port", str(port), "--workers", str(workers),
+                                "--log-level", "warning"], env=env)
+
+    def ready():
+        with socket.socket() as sock:
+            return sock.connect_ex(("127.0.0.1", port)) == 0
+
+    try:
+        _wait(ready, 60, "server")
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait(30)
+
+
+def load_benchmark(args):
+    """Seed a database and run the HTTP load scenario against it"""
+    database = docker_postgres() if args.postgres == "docker" else nullcontext({})
+    with database as db_env:
+        env = {**os.environ, **db_env}
+        subprocess.run([sys.executable, "-m", "benchmarks.datagen",
+                        "--users", str(args.users),
+                        "--tasks-per-role", str(args.tasks_per_role),
+                        "--seed", str(args.seed)], env=env, check=True)
+        with server(env, args.workers) as url:
+            return asyncio.run(run_load(url, args.clients, args.requests,
+                                        LOGIN_EMAIL, PASSWORD))
+
+
+def _lower_is_better(name: str):
+    return name.endswith("_ms") or name.endswith("errors")
+
+
+def compare(results, baseline, threshold: float, absolute: float = 0.0):
+    """List of (name, baseline, current) of metrics worse than the threshold.
+
+    A relative threshold means nothing for a zero baseline, so a
+    lower-is-better metric at zero, like an error count, regresses when
+    it grows above ``absolute``.
+    """
+    regressions = []
+    for group, metrics in baseline.items():
+        for name, base in metrics.items():
+            current = results.get(group, {}).get(name)
+            if current is None:
+                continue
+            if _lower_is_better(name):
+                worse = (current > absolute if not base
+                         else current > base * (1 + threshold))
+            else:
+                worse = current < base * (1 - threshold)
+            if worse:
+                regressions.append((f"{group}.{name}", base, current))
+    return regressions
+
+
+def main():
+    """Suite entry point"""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed relative regression, 0.2 is 20%%")
+    parser.add_argument("--absolute-threshold", type=float, default=0.0,
+                        help="allowed growth of lower-is-better metrics with zero baseline")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--postgres", choices=["docker", "env"], default="docker")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tasks-per-role", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20,
+                        help="requests per client")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = {"micro": micro.run(args.users, args.tasks_per_role, args.items,
+                                  args.repeat, args.seed)}
+    if not args.skip_load:
+        results["load"] = load_benchmark(args)
+
+    write_json(args.output, results)
+    print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.threshold,
+                                  args.absolute_threshold)
+        for name, base, current in regressions:
+            print(f"REGRESSION {name}: {base:.1f} -> {current:.1f}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
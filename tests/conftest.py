@@ -0,0 +1,33 @@
+import pytest
+from sqlalchemy import event
+from app.config import settings
+from app.db import engine, replica_engine
+from app.logic.metrics import budget_violations
+
+settings.query_budgets = True
+
+
+@pytest.fixture(autouse=True)
+def check_query_budgets():
+    """Fail the test if a request issued more statements than its route allows"""
+    budget_violations.clear()
+    yield
+    if budget_violations:
+        pytest.fail("Query budget exceeded:\n" + "\n".join(map(str, budget_violations)),
+                    pytrace=False)
+
+
+@pytest.fixture
+def count_queries():
+    """List of SQL statements executed through the sync engines during the test"""
+    statements = []
+    engines = [engine] if replica_engine is None else [engine, replica_engine]
+
+    def before_cursor_execute(_conn, _cursor, statement, *_):
+        statements.append(statement)
+
+    for target in engines:
+        event.listen(target, "before_cursor_execute", before_cursor_execute)
+    yield statements
+    for target in engines:
+        event.remove(target, "before_cursor_execute", before_cursor_execute)
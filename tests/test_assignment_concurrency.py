@@ -0,0 +1,75 @@
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+import faker
+from app.main import app
+
+client = TestClient(app)
+fake = faker.Faker()
+
+USERS = 5
+TASKS = 200
+OPERATIONS = 3000
+
+
+def _signup(role):
+    response = client.post("/auth/signup",
+                           json={"email": fake.unique.email(),
+                                 "password": "secret",
+                                 "first_name": fake.first_name(),
+                                 "last_name": fake.last_name(),
+                                 "role": role,
+                                 "workload": 0.0})
+    assert response.status_code == 201
+    return response.json()
+
+
+def test_concurrent_assign_unassign_keeps_workloads():
+    role = f"stress-{fake.uuid4()}"
+    user_ids = [_signup(role) for _ in range(USERS)]
+    email = fake.unique.email()
+    client.post("/auth/signup", json={"email": email, "password": "secret",
+                                      "first_name": "a", "last_name": "b",
+                                      "role": "admin", "workload": 0.0})
+    token = client.post("/auth/login",
+                        data={"username": email, "password": "secret"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.post("/tasks/bulk",
+                           json=[{"description": fake.street_address(),
+                                  "estimated_time": random.randint(1, 5),
+                                  "needed_role": role} for _ in range(TASKS)])
+    task_ids = [result["task_id"] for result in response.json()]
+    estimated = {task_id: client.get(f"/tasks/{task_id}").json()["estimated_time"]
+                 for task_id in task_ids}
+
+    assignments = {}
+    lock = threading.Lock()
+
+    def operation(_):
+        task_id = random.choice(task_ids)
+        with lock:
+            assignment_id = assignments.pop(task_id, None)
+        if assignment_id is None:
+            response = client.post("/assignment/", headers=headers,
+                                   json={"task_id": task_id,
+                                         "user_id": random.choice(user_ids)})
+            if response.status_code == 201:
+                with lock:
+                    assignments[task_id] = response.json()["assignment_id"]
+        else:
+            client.delete(f"/assignment/{assignment_id}", headers=headers)
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        list(executor.map(operation, range(OPERATIONS)))
+
+    expected = dict.fromkeys(user_ids, 0.0)
+    for assignment in client.get("/assignment/", headers=headers).json():
+        if assignment["task_id"] in estimated:
+            expected[assignment["user_id"]] += estimated[assignment["task_id"]]
+
+    workloads = {user["user_id"]: user["workload"]
+                 for user in client.get("/auth/", headers=headers).json()
+                 if user["user_id"] in expected}
+    assert workloads == expected
@@ -0,0 +1,131 @@
+import time
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+import faker
+import pytest
+from app.config import settings
+from app.logic.events import broker
+from app.main import app
+from app.routes.assignment import delete_assignment
+
+client = TestClient(app)
+fake = faker.Faker()
+
+ROLE = f"expand-{fake.uuid4()}"
+ASSIGNMENTS = 5
+
+
+@pytest.fixture(scope="module", name="user")
+def fixture_user():
+    """Signed up user of ROLE with authorization headers"""
+    email = fake.unique.email()
+    response = client.post("/auth/signup",
+                           json={"email": email, "password": "secret",
+                                 "first_name": fake.first_name(),
+                                 "last_name": fake.last_name(),
+                                 "role": ROLE, "workload": 0.0})
+    token = client.post("/auth/login",
+                        data={"username": email, "password": "secret"}).json()["access_token"]
+    return SimpleNamespace(user_id=response.json(), token=token,
+                           headers={"Authorization": f"Bearer {token}"})
+
+
+def _assign(user):
+    task_id = client.post("/tasks", json={"description": fake.street_address(),
+                                          "needed_role": ROLE}).json()["task_id"]
+    response = client.post("/assignment/", headers=user.headers,
+                           json={"task_id": task_id, "user_id": user.user_id})
+    assert response.status_code == 201
+    return response.json()["assignment_id"]
+
+
+@pytest.fixture(scope="module", name="first_id")
+def fixture_first_id(user):
+    """Id of the first of ASSIGNMENTS consecutive assignments of the user"""
+    return min(_assign(user) for _ in range(ASSIGNMENTS))
+
+
+def test_expand_assignment(user, first_id):
+    response = client.get(f"/assignment/{first_id}", headers=user.headers,
+                          params={"expand": "task,user"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["task"]["task_id"] == body["task_id"]
+    assert body["user"]["user_id"] == user.user_id
+    assert "password" not in body["user"]
+
+    body = client.get(f"/assignment/{first_id}", headers=user.headers).json()
+    assert "task" not in body and "user" not in body
+
+
+def test_unknown_expand(user, first_id):
+    response = client.get(f"/assignment/{first_id}", headers=user.headers,
+                          params={"expand": "owner"})
+    assert response.status_code == 422
+
+
+def test_expand_query_count_does_not_grow(user, first_id, count_queries):
+    params = {"expand": "task,user", "after": first_id - 1}
+    client.get("/assignment/", headers=user.headers, params={**params, "limit": 1})
+
+    count_queries.clear()
+    response = client.get("/assignment/", headers=user.headers, params={**params, "limit": 1})
+    assert len(response.json()) == 1
+    single = len(count_queries)
+
+    count_queries.clear()
+    response = client.get("/assignment/", headers=user.headers,
+                          params={**params, "limit": ASSIGNMENTS})
+    assert len(response.json()) == ASSIGNMENTS
+    assert len(count_queries) == single
+
+
+def test_delete_assignment_query_count(user, count_queries):
+    assignment_id = _assign(user)
+    count_queries.clear()
+    response = client.delete(f"/assignment/{assignment_id}", headers=user.headers)
+    assert response.status_code == 200
+    assert len(count_queries) <= delete_assignment.query_budget
+
+
+def test_update_task_corrects_workload(user):
+    task_id = client.get(f"/assignment/{_assign(user)}", headers=user.headers).json()["task_id"]
+    before = client.get("/auth/me", headers=user.headers).json()["workload"]
+    response = client.patch(f"/tasks/{task_id}", json={"estimated_time": 3.0})
+    assert response.status_code == 200
+    assert client.get("/auth/me", headers=user.headers).json()["workload"] == before + 2.0
+
+
+def test_created_task_is_placed_incrementally(user, monkeypatch):
+    monkeypatch.setattr(settings, "incremental_scheduling", True)
+    before = client.get("/auth/me", headers=user.headers).json()["workload"]
+    response = client.post("/tasks", json={"description": fake.street_address(),
+                                           "needed_role": ROLE, "estimated_time": 2.0})
+    assert response.status_code == 201
+    assert client.get("/auth/me", headers=user.headers).json()["workload"] == before + 2.0
+    unassigned = client.get("/tasks", params={"needed_role": ROLE, "assigned": False})
+    if unassigned.status_code == 200:
+        assert response.json()["task_id"] not in [task["task_id"] for task in unassigned.json()]
+
+
+def test_stream_websocket(user, monkeypatch):
+    # the test client runs no lifespan, so there is no NOTIFY listener
+    monkeypatch.setattr(settings, "event_broker", "local")
+    with client.websocket_connect(f"/assignment/stream?token={user.token}"
+                                  f"&user_id={user.user_id}") as websocket:
+        while not broker:
+            time.sleep(0.01)
+        assignment_id = _assign(user)
+        created = websocket.receive_json()
+        workload = websocket.receive_json()
+    assert created["type"] == "assignment.created"
+    assert created["assignment_id"] == assignment_id
+    assert workload["type"] == "workload"
+    assert workload["user_id"] == user.user_id
+
+
+def test_stream_websocket_requires_token():
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/assignment/stream?token=invalid"):
+            pass
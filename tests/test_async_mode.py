@@ -0,0 +1,65 @@
+import asyncio
+import inspect
+import os
+import subprocess
+import sys
+from pathlib import Path
+from fastapi import Depends
+from app import db
+
+# Routes are adapted to the session mode when they are created, so the
+# application is imported with DB_ASYNC=true in a process of its own.
+SCRIPT = """
+import faker
+from fastapi.testclient import TestClient
+from app.db import async_engine
+from app.main import app
+
+assert async_engine is not None
+client = TestClient(app)
+fake = faker.Faker()
+email = fake.email()
+
+response = client.post("/auth/signup", json={"email": email, "password": "secret",
+                                             "first_name": fake.first_name(),
+                                             "last_name": fake.last_name(),
+                                             "role": "junior", "workload": 0.0})
+assert response.status_code == 201, response.text
+token = client.post("/auth/login",
+                    data={"username": email, "password": "secret"}).json()["access_token"]
+me = client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+assert me.json()["email"] == email, me.text
+
+response = client.post("/tasks", json={"description": fake.street_address(),
+                                       "needed_role": "junior"})
+assert response.status_code == 201, response.text
+task_id = response.json()["task_id"]
+assert client.get(f"/tasks/{task_id}").json()["task_id"] == task_id
+assert client.delete(f"/tasks/{task_id}").status_code == 200
+"""
+
+
+def test_routes_in_async_mode():
+    result = subprocess.run([sys.executable, "-c", SCRIPT],
+                            env={**os.environ, "DB_ASYNC": "true"},
+                            cwd=Path(__file__).parents[1],
+                            capture_output=True, text=True, timeout=120, check=False)
+    assert result.returncode == 0, result.stderr
+
+
+def test_session_mode_runs_endpoint_through_run_sync(monkeypatch):
+    monkeypatch.setattr(db.cnf, "db_async", True)
+
+    class FakeAsyncSession:  # pylint: disable=too-few-public-methods
+        """Session which passes a sync session to functions like AsyncSession"""
+
+        async def run_sync(self, func):
+            """Run func with the sync session"""
+            return func("sync session")
+
+    def endpoint(value: int, session=Depends(db.get_session)):
+        return value, session
+
+    wrapped = db.session_mode(endpoint)
+    assert inspect.iscoroutinefunction(wrapped)
+    assert asyncio.run(wrapped(value=1, session=FakeAsyncSession())) == (1, "sync session")
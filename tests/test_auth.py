@@ -1,5 +1,6 @@
 from fastapi.testclient import TestClient
 import faker
+from app.logic.cache import principal_cache
 from app.main import app
 
 client = TestClient(app)
@@ -38,3 +39,32 @@ def test_me():
     response = client.get("/utils/me", headers={"Authorization": f"Bearer {client.auth_token}"})
     assert response.status_code == 200
     assert response.json() == client.new_user_id
+
+
+def test_public_profile():
+    headers = {"Authorization": f"Bearer {client.auth_token}"}
+    response = client.get("/auth/me", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["email"] == client.fake_user_email
+    assert "password" not in response.json()
+
+    response = client.get("/auth/", headers=headers,
+                          params={"after": client.new_user_id - 1, "limit": 1})
+    assert response.json()[0]["user_id"] == client.new_user_id
+    assert "password" not in response.json()[0]
+
+
+def test_me_does_not_read_password(count_queries):
+    principal_cache.clear()
+    response = client.get("/auth/me", headers={"Authorization": f"Bearer {client.auth_token}"})
+    assert response.status_code == 200
+    assert count_queries
+    assert not any("password" in statement for statement in count_queries)
+
+
+def test_revoke():
+    headers = {"Authorization": f"Bearer {client.auth_token}"}
+    response = client.post("/auth/revoke", headers=headers)
+    assert response.status_code == 204
+    response = client.post("/auth/revoke", headers=headers)
+    assert response.status_code == 401
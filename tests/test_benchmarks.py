@@ -0,0 +1,19 @@
+from benchmarks.datagen import make_tasks, make_users
+from benchmarks.suite import compare
+
+
+def test_datagen_is_reproducible():
+    assert make_tasks(10, seed=1) == make_tasks(10, seed=1)
+    assert [user["email"] for user in make_users(3, seed=1)] == \
+        [user["email"] for user in make_users(3, seed=1)]
+
+
+def test_compare_with_baseline():
+    baseline = {"micro": {"jwt_decode": 1000.0},
+                "load": {"throughput": 100.0, "p99_ms": 50.0, "errors": 0}}
+    results = {"micro": {"jwt_decode": 900.0},
+               "load": {"throughput": 70.0, "p99_ms": 70.0, "errors": 3}}
+    assert [name for name, _, _ in compare(results, baseline, 0.2)] == \
+        ["load.throughput", "load.p99_ms", "load.errors"]
+    assert "load.errors" not in [name for name, _, _ in compare(results, baseline, 0.2,
+                                                                absolute=5)]
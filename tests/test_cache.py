@@ -0,0 +1,26 @@
+from types import SimpleNamespace
+from app.logic.cache import PrincipalCache, TTLCache
+
+
+def test_lru_eviction_and_counters():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 2, "misses": 1}
+
+
+def test_expired_entry_is_miss():
+    cache = TTLCache(maxsize=2, ttl=-1)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_invalidate_principal_by_user_id():
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    cache.set("user@example.com", SimpleNamespace(user_id=7))
+    cache.invalidate_user(7)
+    assert cache.get("user@example.com") is None
@@ -0,0 +1,82 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from app.config import settings
+from app.logic.events import (MAX_PAYLOAD, RESYNC, EventBroker, assignment_event, publish,
+                              sse_message, workload_event)
+
+
+def test_broker_filters_by_role_and_user():
+    async def scenario():
+        broker = EventBroker(10)
+        everything = broker.subscribe()
+        seniors = broker.subscribe(role="senior")
+        user = broker.subscribe(user_id=2)
+        broker.deliver([assignment_event("created", 1, 10, 1, "senior", 2.0),
+                        workload_event(2, "junior", 3.0, 5.0),
+                        RESYNC])
+        await asyncio.sleep(0)
+        return [[queue.get_nowait()["type"] for _ in range(queue.qsize())]
+                for queue in (everything.queue, seniors.queue, user.queue)]
+
+    assert asyncio.run(scenario()) == [["assignment.created", "workload", "resync"],
+                                       ["assignment.created", "resync"],
+                                       ["workload", "resync"]]
+
+
+def test_slow_client_gets_resync():
+    async def scenario():
+        broker = EventBroker(3)
+        subscription = broker.subscribe()
+        broker.deliver([workload_event(1, "junior", 1.0, float(i)) for i in range(5)])
+        await asyncio.sleep(0)
+        return [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+
+    received = asyncio.run(scenario())
+    assert received[0] == RESYNC
+    assert [message["workload"] for message in received[1:]] == [3.0, 4.0]
+
+
+def test_unsubscribed_client_gets_nothing():
+    async def scenario():
+        broker = EventBroker(3)
+        subscription = broker.subscribe()
+        broker.unsubscribe(subscription)
+        broker.deliver([RESYNC])
+        await asyncio.sleep(0)
+        return subscription.queue.empty(), len(broker)
+
+    assert asyncio.run(scenario()) == (True, 0)
+
+
+def test_local_publish_waits_for_commit(monkeypatch):
+    monkeypatch.setattr(settings, "event_broker", "local")
+    session = SimpleNamespace(info={})
+    publish(session, [RESYNC])
+    assert session.info["events"] == [RESYNC]
+
+
+def test_notify_payloads_fit_the_limit(monkeypatch):
+    monkeypatch.setattr(settings, "event_broker", "postgres")
+    sent = []
+    session = SimpleNamespace(execute=lambda statement, params: sent.extend(params["payloads"]))
+    events = [workload_event(i, "r" * 1000, 1.0, float(i)) for i in range(20)]
+    publish(session, events)
+    assert len(sent) > 1
+    assert all(len(payload.encode()) <= MAX_PAYLOAD for payload in sent)
+    assert [item for payload in sent for item in json.loads(payload)] == events
+
+
+def test_oversized_event_sent_as_refetch_marker(monkeypatch):
+    monkeypatch.setattr(settings, "event_broker", "postgres")
+    sent = []
+    session = SimpleNamespace(execute=lambda statement, params: sent.extend(params["payloads"]))
+    publish(session, [workload_event(1, "r" * MAX_PAYLOAD, 1.0, 2.0), RESYNC])
+    assert all(len(payload.encode()) <= MAX_PAYLOAD for payload in sent)
+    assert [item for payload in sent for item in json.loads(payload)] == \
+        [{"type": "workload", "user_id": 1, "refetch": True}, RESYNC]
+
+
+def test_sse_message():
+    assert sse_message(RESYNC) == b'event: resync\ndata: {"type":"resync"}\n\n'
+    assert sse_message(None) == b": heartbeat\n\n"
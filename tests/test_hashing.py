@@ -0,0 +1,32 @@
+import pytest
+from app.logic.hashing import HashPool, HashQueueFull, hash_secret, verify_secret
+from app.logic.ratelimit import TokenBucketLimiter
+
+
+def test_hash_in_process_pool():
+    pool = HashPool(workers=1, queue_size=4)
+    try:
+        password_hash = pool.run(hash_secret, "secret")
+        assert pool.run(verify_secret, "secret", password_hash)
+        assert not pool.run(verify_secret, "wrong", password_hash)
+        stats = pool.stats()
+        assert stats["completed"] == 3
+        assert stats["depth"] == 0
+    finally:
+        pool.shutdown()
+
+
+def test_full_queue_is_rejected():
+    pool = HashPool(workers=0, queue_size=0)
+    with pytest.raises(HashQueueFull):
+        pool.run(hash_secret, "secret")
+    assert pool.stats()["rejected"] == 1
+
+
+def test_token_bucket():
+    limiter = TokenBucketLimiter(rate=1, burst=2)
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == 0
+    assert 0 < limiter.acquire("a") <= 1
+    assert limiter.acquire("b") == 0
+    assert limiter.stats() == {"keys": 2, "limited": 1}
@@ -0,0 +1,26 @@
+import queue
+from sqlmodel import Session
+from app.db import engine
+from app.logic.invalidation import notify, start_listener, subscribe
+
+received = queue.Queue()
+subscribe("test_entity", received.put)
+
+
+def test_notify_reaches_listener_after_commit():
+    listener = start_listener()
+    try:
+        # The listener invalidates everything once it is connected
+        assert received.get(timeout=10) is None
+
+        with Session(engine) as session:
+            notify(session, "test_entity", [41])
+            session.rollback()
+            notify(session, "test_entity", [42, 43])
+            session.commit()
+
+        assert received.get(timeout=10) == 42
+        assert received.get(timeout=10) == 43
+        assert received.empty()
+    finally:
+        listener.stop()
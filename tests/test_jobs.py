@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+from fastapi.testclient import TestClient
+import faker
+import pytest
+from sqlalchemy import text
+from sqlmodel import Session
+from app.db import engine
+from app.logic.jobs import SCHEDULE_LOCK_KEY, recover_schedule_jobs
+from app.main import app
+from app.schemas import schemas
+
+client = TestClient(app)
+fake = faker.Faker()
+
+
+@pytest.fixture(scope="module", name="headers")
+def fixture_headers():
+    email = fake.unique.email()
+    client.post("/auth/signup", json={"email": email, "password": "secret",
+                                      "first_name": fake.first_name(),
+                                      "last_name": fake.last_name(),
+                                      "role": f"jobs-{fake.uuid4()}", "workload": 0.0})
+    token = client.post("/auth/login",
+                        data={"username": email, "password": "secret"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_schedule_job_runs_in_background(headers):
+    response = client.post("/assignment/schedule", headers=headers)
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued"
+
+    # the test client runs background tasks before returning the response
+    response = client.get(f"/assignment/schedule/{job['job_id']}", headers=headers)
+    assert response.status_code == 200
+    job = response.json()
+    assert job["status"] == "done"
+    assert job["placed"] == job["report"]["placed"]
+
+
+def test_concurrent_schedule_job_rejected(headers):
+    with engine.connect() as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": SCHEDULE_LOCK_KEY})
+        try:
+            job_id = client.post("/assignment/schedule", headers=headers).json()["job_id"]
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"),
+                               {"key": SCHEDULE_LOCK_KEY})
+    job = client.get(f"/assignment/schedule/{job_id}", headers=headers).json()
+    assert job["status"] == "rejected"
+
+
+def test_job_of_stopped_worker_is_failed(headers):
+    job_id = fake.uuid4()
+    with Session(engine) as session:
+        session.add(schemas.ScheduleJob(job_id=job_id, mode="greedy", status="running",
+                                        created_at=datetime.now(timezone.utc)))
+        session.commit()
+    recover_schedule_jobs()
+    job = client.get(f"/assignment/schedule/{job_id}", headers=headers).json()
+    assert job["status"] == "failed"
@@ -0,0 +1,18 @@
+from fastapi.testclient import TestClient
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_metrics_by_route_template():
+    client.get("/utils/principal-cache")
+    client.get("/tasks/not-a-number")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert ('http_request_duration_seconds_count{method="GET",'
+            'route="/utils/principal-cache",status="401"}') in response.text
+    assert ('http_request_duration_seconds_count{method="GET",'
+            'route="/tasks/{task_id}",status="422"}') in response.text
+    assert 'http_request_db_queries_count{method="GET",route="/utils/principal-cache"}' \
+        in response.text
@@ -0,0 +1,38 @@
+from fastapi import APIRouter
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from app.logic.metrics import budget_violations, query_budget, request_queries
+from app.main import app
+from app.routes import assignment, auth, task
+
+
+def test_every_route_has_budget():
+    missing = [route.path for router in (task.router, assignment.router, auth.router)
+               for route in router.routes
+               if isinstance(route, APIRoute)
+               and getattr(route.endpoint, "query_budget", None) is None]
+    assert not missing
+
+
+def test_budget_violation_reported():
+    router = APIRouter()
+
+    @router.get("/budget-test")
+    @query_budget(1)
+    def endpoint():
+        stats = request_queries.get()
+        for statement in ("SELECT 1", "SELECT 2"):
+            stats.count += 1
+            stats.statements.append(statement)
+
+    app.include_router(router)
+    try:
+        TestClient(app).get("/budget-test")
+        assert len(budget_violations) == 1
+        violation = str(budget_violations[0])
+        assert "GET /budget-test: 2 statements, budget 1" in violation
+        assert "2. SELECT 2" in violation
+    finally:
+        budget_violations.clear()
+        app.router.routes[:] = [route for route in app.router.routes
+                                if getattr(route, "path", None) != "/budget-test"]
@@ -0,0 +1,158 @@
+import asyncio
+import time
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from starlette.requests import Request
+from app import db
+from app.db import (READ_PRIMARY_COOKIE, ReadYourWritesMiddleware, engine, replica_engine,
+                    replica_state, uses_replica)
+from app.logic.auth import create_access_token
+from app.logic.cache import recent_writers
+from app.main import app
+
+needs_replica = pytest.mark.skipif(replica_engine is None,
+                                   reason="db_replica_host is not configured")
+
+
+def _request(method="GET", cookie=None, token=None):
+    headers = [(b"cookie", f"{READ_PRIMARY_COOKIE}={cookie}".encode())] if cookie else []
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    return Request({"type": "http", "method": method, "headers": headers})
+
+
+def test_uses_replica():
+    assert uses_replica(_request())
+    assert uses_replica(_request(cookie=time.time() - 1))
+    assert uses_replica(_request(cookie="garbage"))
+    assert not uses_replica(_request("POST"))
+    assert not uses_replica(_request(cookie=time.time() + 5))
+
+
+def test_lagging_replica_is_not_used(monkeypatch):
+    monkeypatch.setattr(replica_state, "lag", float("inf"))
+    assert not uses_replica(_request())
+
+
+def test_token_client_reads_primary_after_write(monkeypatch):
+    monkeypatch.setattr(db, "replica_engine", object())
+    monkeypatch.setattr(db.cnf, "cache_invalidation", False)
+    writer = create_access_token({"sub": "writer@example.com"})
+    reader = create_access_token({"sub": "reader@example.com"})
+
+    async def endpoint(_scope, _receive, send):
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def ignore(_message):
+        pass
+
+    middleware = ReadYourWritesMiddleware(endpoint)
+    asyncio.run(middleware(_request("POST", token=writer).scope, None, ignore))
+    try:
+        # no cookie is sent back, the token subject keeps reads on the primary
+        assert not uses_replica(_request(token=writer))
+        assert uses_replica(_request(token=reader))
+        assert uses_replica(_request(token="garbage"))
+    finally:
+        recent_writers.clear()
+
+
+def _engine_of_request(client, method, path, **kwargs):
+    used = set()
+
+    def record(conn, *_):
+        used.add(conn.engine)
+
+    for target in (engine, replica_engine):
+        event.listen(target, "before_cursor_execute", record)
+    try:
+        response = getattr(client, method)(path, **kwargs)
+    finally:
+        for target in (engine, replica_engine):
+            event.remove(target, "before_cursor_execute", record)
+    return response, used
+
+
+@needs_replica
+def test_reads_go_to_replica_until_own_write():
+    client = TestClient(app)
+    _, used = _engine_of_request(client, "get", "/tasks/")
+    assert used == {replica_engine}
+
+    response, used = _engine_of_request(client, "post", "/tasks/",
+                                        json={"description": "replica", "needed_role": "junior"})
+    assert response.status_code == 201
+    assert used == {engine}
+    assert READ_PRIMARY_COOKIE in response.cookies
+
+    response, used = _engine_of_request(client, "get", f"/tasks/{response.json()['task_id']}")
+    assert response.status_code == 200
+    assert used == {engine}
+
+    client.cookies.clear()
+    _, used = _engine_of_request(client, "get", "/tasks/")
+    assert used == {replica_engine}
+
+
+@needs_replica
+def test_replica_lag_metric():
+    with TestClient(app) as client:
+        response = client.get("/metrics")
+    assert "db_replica_lag_seconds" in response.text
+
+
+@needs_replica
+def test_stale_replica_row_not_served_after_write():
+    client = TestClient(app)
+    task_id = client.post("/tasks/", json={"description": "before",
+                                           "needed_role": "junior"}).json()["task_id"]
+    client.cookies.clear()
+    time.sleep(1)  # let the replica replay the insert
+    assert client.get(f"/tasks/{task_id}").json()["description"] == "before"
+
+    with replica_engine.connect() as connection:
+        connection.execute(text("SELECT pg_wal_replay_pause()"))
+        connection.commit()
+    try:
+        client.patch(f"/tasks/{task_id}", json={"description": "after"})
+        # the client's own write: read from the primary, not the cached replica row
+        assert client.get(f"/tasks/{task_id}").json()["description"] == "after"
+
+        client.cookies.clear()
+        stale = client.get(f"/tasks/{task_id}")
+        assert stale.json()["description"] == "before"
+        # the replica row is cached under the replica's version only
+        response = client.get(f"/tasks/{task_id}",
+                              cookies={READ_PRIMARY_COOKIE: str(time.time() + 5)})
+        assert response.json()["description"] == "after"
+        assert response.headers["ETag"] != stale.headers["ETag"]
+    finally:
+        with replica_engine.connect() as connection:
+            connection.execute(text("SELECT pg_wal_replay_resume()"))
+            connection.commit()
+
+
+@needs_replica
+def test_token_client_without_cookies_reads_own_write():
+    client = TestClient(app)
+    email = f"replica-{time.time()}@example.com"
+    client.post("/auth/signup", json={"email": email, "password": "secret",
+                                      "first_name": "Replica", "last_name": "Client",
+                                      "role": "junior", "workload": 0.0})
+    token = client.post("/auth/login",
+                        data={"username": email, "password": "secret"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.cookies.clear()
+
+    _, used = _engine_of_request(client, "get", "/tasks/", headers=headers)
+    assert used == {replica_engine}
+
+    response = client.post("/tasks/", headers=headers,
+                           json={"description": "token client", "needed_role": "junior"})
+    assert response.status_code == 201
+    client.cookies.clear()
+    _, used = _engine_of_request(client, "get", f"/tasks/{response.json()['task_id']}",
+                                 headers=headers)
+    assert used == {engine}
@@ -0,0 +1,143 @@
+import random
+from datetime import date, timedelta
+from types import SimpleNamespace
+import pytest
+from sqlalchemy.exc import IntegrityError
+from app.logic import schedule
+from app.logic.schedule import place_heap, place_linear, place_optimized
+
+test_roles = ["junior", "middle", "senior", "team lead", "manager"]
+
+
+def make_data(seed):
+    rng = random.Random(seed)
+    users = [SimpleNamespace(user_id=i, role=rng.choice(test_roles),
+                             workload=float(rng.randint(0, 3)))
+             for i in range(1, 40)]
+    tasks = [SimpleNamespace(task_id=i, needed_role=rng.choice(test_roles + ["intern"]),
+                             estimated_time=float(rng.randint(1, 5)))
+             for i in range(1, 2000)]
+    return tasks, users
+
+
+def test_heap_matches_linear():
+    for seed in range(5):
+        tasks, linear_users = make_data(seed)
+        _, heap_users = make_data(seed)
+        assert place_heap(tasks, heap_users) == place_linear(tasks, linear_users)
+        assert ([u.workload for u in heap_users] ==
+                [u.workload for u in linear_users])
+
+
+def test_heap_skips_unknown_role():
+    tasks, users = make_data(0)
+    placed = {task_id for task_id, _ in place_heap(tasks, users)}
+    assert all(task.task_id not in placed
+               for task in tasks if task.needed_role == "intern")
+
+
+def make_prioritized(seed):
+    tasks, users = make_data(seed)
+    rng = random.Random(seed)
+    for task in tasks:
+        task.priority = rng.randint(1, 5)
+        task.deadline = date.today() + timedelta(days=rng.randint(0, 30))
+    return tasks, users
+
+
+def makespan(users):
+    return max(user.workload for user in users)
+
+
+def test_optimized_places_every_task_and_balances():
+    for seed in range(5):
+        tasks, greedy_users = make_prioritized(seed)
+        _, optimized_users = make_prioritized(seed)
+        greedy = place_heap(tasks, greedy_users)
+        optimized = place_optimized(tasks, optimized_users, time_budget=5.0)
+        assert {t for t, _ in optimized} == {t for t, _ in greedy}
+        assert makespan(optimized_users) <= makespan(greedy_users)
+        assert (sum(u.workload for u in optimized_users) ==
+                pytest.approx(sum(u.workload for u in greedy_users)))
+
+
+def test_optimized_respects_time_budget():
+    tasks, users = make_prioritized(0)
+    assert not place_optimized(tasks, users, time_budget=0.0)
+
+
+class FakeSession:
+    """Session returning prepared rows for every exec call"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+
+    def exec(self, _statement):
+        rows = self.results.pop(0)
+        return SimpleNamespace(all=lambda: rows)
+
+    def rollback(self):
+        pass
+
+
+def test_greedy_reports_progress_for_saved_chunks(monkeypatch):
+    users = [(1, "junior", 0.0)]
+    chunks = [[SimpleNamespace(task_id=i, needed_role="junior", estimated_time=1.0)
+               for i in range(start, start + 2)] for start in (1, 3)]
+    monkeypatch.setattr(schedule, "_save_placements",
+                        lambda _session, placements, *_: len(placements))
+    monkeypatch.setattr(schedule, "_report", lambda _session, _mode, placed, _time: placed)
+    reported = []
+    placed = schedule._schedule_tasks(  # pylint: disable=protected-access
+        FakeSession(users, *chunks, []),
+        schedule.ScheduleMode.GREEDY, 2, reported.append)
+    assert placed == 4
+    assert reported == [2, 4]
+
+
+class PlacementSession:
+    """Session returning one user row for every lookup"""
+
+    def __init__(self, user, flush_error=None):
+        self.user = user
+        self.flush_error = flush_error
+        self.added = []
+        self.rolled_back = False
+
+    def exec(self, _statement):
+        return SimpleNamespace(first=lambda: self.user)
+
+    def add(self, row):
+        self.added.append(row)
+
+    def flush(self):
+        if self.flush_error:
+            raise self.flush_error
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def _stub_index(monkeypatch, candidate):
+    index = SimpleNamespace(least_loaded=lambda _session, _role: candidate,
+                            update=lambda *_: None, remove=lambda _user_id: None)
+    monkeypatch.setattr(schedule, "workload_index", index)
+
+
+def test_place_task_skips_user_with_stale_workload(monkeypatch):
+    _stub_index(monkeypatch, (1, 0.0))
+    session = PlacementSession(SimpleNamespace(user_id=1, role="junior", workload=2.0))
+    task = SimpleNamespace(task_id=1, needed_role="junior", estimated_time=1.0)
+    assert schedule.place_task(session, task) is None
+    assert not session.added
+    assert session.rolled_back
+
+
+def test_place_task_already_assigned(monkeypatch):
+    _stub_index(monkeypatch, (1, 0.0))
+    conflict = IntegrityError("INSERT INTO assignment", {}, Exception("duplicate key"))
+    session = PlacementSession(SimpleNamespace(user_id=1, role="junior", workload=0.0),
+                               flush_error=conflict)
+    task = SimpleNamespace(task_id=1, needed_role="junior", estimated_time=1.0)
+    assert schedule.place_task(session, task) is None
+    assert session.rolled_back
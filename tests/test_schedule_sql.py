@@ -0,0 +1,43 @@
+from datetime import date
+from types import SimpleNamespace
+import faker
+import pytest
+from sqlalchemy import insert
+from sqlmodel import Session, col, select
+from app.db import engine
+from app.logic.schedule import place_heap, schedule_tasks_sql
+from app.schemas import schemas
+
+fake = faker.Faker()
+
+
+@pytest.mark.parametrize("workloads, times", [
+    ([0.0, 100.0], [1.0] * 10),
+    ([0.0, 2.0, 5.0], [1.0] * 12),
+    ([3.0, 0.0, 3.0, 1.0], [2.0] * 9),
+])
+def test_sql_matches_greedy_with_unequal_workloads(workloads, times):
+    role = f"sql-{fake.uuid4()}"
+    with Session(engine) as session:
+        user_ids = session.scalars(
+            insert(schemas.User).returning(schemas.User.user_id, sort_by_parameter_order=True),
+            [{"email": fake.unique.email(), "password": "", "first_name": "",
+              "last_name": "", "role": role, "workload": workload}
+             for workload in workloads]).all()
+        task_ids = session.scalars(
+            insert(schemas.Task).returning(schemas.Task.task_id, sort_by_parameter_order=True),
+            [{"description": "", "needed_role": role, "estimated_time": time,
+              "deadline": date.today(), "priority": 1}
+             for time in times]).all()
+        session.commit()
+
+        schedule_tasks_sql(session)
+        placed = dict(session.exec(select(schemas.Assignment.task_id,
+                                          schemas.Assignment.user_id)
+                                   .where(col(schemas.Assignment.task_id).in_(task_ids))).all())
+
+    users = [SimpleNamespace(user_id=user_id, role=role, workload=workload)
+             for user_id, workload in zip(user_ids, workloads)]
+    tasks = [SimpleNamespace(task_id=task_id, needed_role=role, estimated_time=time)
+             for task_id, time in zip(task_ids, times)]
+    assert placed == dict(place_heap(tasks, users))
@@ -1,6 +1,10 @@
+import json
 from datetime import date, timedelta
 from fastapi.testclient import TestClient
 import faker
+import msgpack
+import pytest
+from app.logic.cache import task_cache
 from app.main import app
 
 client = TestClient(app)
@@ -25,14 +29,117 @@ def test_get_tasks():
     response = client.get("/tasks")
     assert response.status_code == 200
 
+def test_get_tasks_page():
+    response = client.get("/tasks", params={"limit": 1})
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert "X-Next-Cursor" in response.headers or response.json()[0]["task_id"] == task_id
+
+def test_get_tasks_ndjson():
+    response = client.get("/tasks", headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    ids = [json.loads(line)["task_id"] for line in response.text.splitlines()]
+    assert task_id in ids
+    assert ids == sorted(ids)
+    assert response.headers["ETag"] != client.get("/tasks").headers["ETag"]
+    assert response.headers["Vary"] == "Accept"
+
+def test_get_tasks_msgpack():
+    response = client.get("/tasks", headers={"Accept": "application/msgpack"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/msgpack"
+    assert task_id in [task["task_id"] for task in msgpack.unpackb(response.content)]
+
 def test_get_task_by_id():
     response = client.get(f"/tasks/{task_id}")
     assert response.status_code == 200
 
+def test_get_task_not_modified():
+    etag = client.get(f"/tasks/{task_id}").headers["ETag"]
+    response = client.get(f"/tasks/{task_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["Vary"] == "Accept"
+
+def test_etag_depends_on_format():
+    msgpack_headers = {"Accept": "application/msgpack"}
+    as_json = client.get(f"/tasks/{task_id}")
+    as_msgpack = client.get(f"/tasks/{task_id}", headers=msgpack_headers)
+    assert as_json.headers["ETag"] != as_msgpack.headers["ETag"]
+    assert as_json.headers["Vary"] == as_msgpack.headers["Vary"] == "Accept"
+    response = client.get(f"/tasks/{task_id}",
+                          headers={**msgpack_headers, "If-None-Match": as_json.headers["ETag"]})
+    assert response.status_code == 200
+
+def test_cached_task_of_old_version_not_served():
+    current = client.get(f"/tasks/{task_id}").json()
+    # entry left behind by an eviction which has not arrived yet
+    task_cache.set(task_id, ('"task-0"', {**current, "description": "stale"}))
+    response = client.get(f"/tasks/{task_id}")
+    assert response.json()["description"] == current["description"]
+
 def test_update_task():
+    etag = client.get("/tasks").headers["ETag"]
     response = client.patch(f"/tasks/{task_id}", json={"description": fake.street_address()})
     assert response.status_code == 200
+    response = client.get("/tasks", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
 
 def test_delete_task():
     response = client.delete(f"/tasks/{task_id}")
     assert response.status_code == 200
+
+def test_bulk_tasks():
+    items = [{"description": fake.street_address(),
+              "needed_role": test_roles[i % len(test_roles)]} for i in range(3)]
+    items.append({"description": fake.street_address(), "priority": 10, "needed_role": "junior"})
+    response = client.post("/tasks/bulk", json=items)
+    assert response.status_code == 200
+    results = response.json()
+    assert [r["status_code"] for r in results] == [201, 201, 201, 422]
+    ids = [r["task_id"] for r in results[:3]]
+
+    response = client.patch("/tasks/bulk", json=[{"task_id": ids[0], "priority": 5},
+                                                 {"task_id": ids[1], "unknown": 1},
+                                                 {"task_id": [ids[2]], "priority": 1},
+                                                 {"task_id": True, "priority": 1}])
+    assert [r["status_code"] for r in response.json()] == [200, 400, 422, 422]
+    assert client.get(f"/tasks/{ids[0]}").json()["priority"] == 5
+
+    response = client.request("DELETE", "/tasks/bulk", json=ids + [-1])
+    assert [r["status_code"] for r in response.json()] == [200, 200, 200, 404]
+
+@pytest.fixture(scope="module", name="headers")
+def fixture_headers():
+    email = fake.unique.email()
+    client.post("/auth/signup", json={"email": email, "password": "secret",
+                                      "first_name": fake.first_name(),
+                                      "last_name": fake.last_name(),
+                                      "role": "junior", "workload": 0.0})
+    token = client.post("/auth/login",
+                        data={"username": email, "password": "secret"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+def test_import_export_require_auth():
+    response = client.post("/tasks/import", files={"file": ("tasks.csv", "", "text/csv")})
+    assert response.status_code == 401
+    assert client.get("/tasks/export").status_code == 401
+
+def test_import_export_tasks(headers):
+    marker = fake.uuid4()
+    rows = ["description,deadline,priority,estimated_time,needed_role",
+            f"{marker},{date.today() + timedelta(days=7)},3,2,junior",
+            f"{marker},,1,1,Senior",
+            f"{marker},,10,1,junior"]
+    response = client.post("/tasks/import", headers=headers,
+                           files={"file": ("tasks.csv", "\n".join(rows), "text/csv")})
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 2
+    assert report["rejected"] == 1
+    assert report["errors"][0]["line"] == 4
+
+    response = client.get("/tasks/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text.count(marker) == 2
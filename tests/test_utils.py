@@ -0,0 +1,33 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.logic.auth import get_principal
+from app.main import app
+from app.schemas.schemas import Principal
+
+client = TestClient(app)
+
+DIAGNOSTICS = ["/utils/db-pool", "/utils/principal-cache", "/utils/hash-pool"]
+
+
+@pytest.fixture(name="signed_in")
+def fixture_signed_in():
+    app.dependency_overrides[get_principal] = lambda: Principal(
+        user_id=1, email="user@example.com", role="junior")
+    yield
+    app.dependency_overrides.pop(get_principal)
+
+
+def test_diagnostics_require_auth():
+    assert [client.get(path).status_code for path in DIAGNOSTICS] == [401] * len(DIAGNOSTICS)
+
+
+@pytest.mark.usefixtures("signed_in")
+def test_pool_stats():
+    response = client.get("/utils/db-pool")
+    assert response.status_code == 200
+    stats = response.json()
+    assert "sync" in stats
+    for pool in stats.values():
+        assert set(pool) == {"size", "checked_out", "idle", "overflow", "connects",
+                             "checkouts", "timeouts", "wait_time_total", "wait_time_max"}
+        assert pool["checked_out"] + pool["idle"] <= pool["size"] + pool["overflow"]
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+from sqlalchemy.util import await_only, greenlet_spawn
+from app.logic.workload import WorkloadIndex
+
+ROWS = [(1, "junior", 3.0), (2, "junior", 1.0), (3, "senior", 2.0)]
+
+
+class YieldingSession:  # pylint: disable=too-few-public-methods
+    """Session whose queries yield to the event loop like AsyncSession.run_sync"""
+
+    def exec(self, _statement):
+        await_only(asyncio.sleep(0.05))
+        return SimpleNamespace(all=lambda: ROWS)
+
+
+def test_concurrent_lookups_in_one_event_loop():
+    index = WorkloadIndex()
+    results = []
+
+    async def requests():
+        session = YieldingSession()
+        results.extend(await asyncio.gather(
+            greenlet_spawn(index.least_loaded, session, "junior"),
+            greenlet_spawn(index.least_loaded, session, "senior"),
+            greenlet_spawn(lambda: index.update(2, "junior", 5.0))))
+
+    # a deadlock would block the loop thread forever
+    thread = threading.Thread(target=asyncio.run, args=(requests(),), daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert results[:2] == [(2, 1.0), (3, 2.0)]
+
+
+def test_user_changed_during_load_is_reread():
+    index = WorkloadIndex()
+
+    class Session:  # pylint: disable=too-few-public-methods
+        """Session changing a user while the index loads"""
+        calls = 0
+
+        def exec(self, _statement):
+            self.calls += 1
+            if self.calls == 1:
+                index.update(2, "junior", 9.0)
+                return SimpleNamespace(all=lambda: ROWS)
+            return SimpleNamespace(all=lambda: [(2, "junior", 9.0)])
+
+    session = Session()
+    assert index.least_loaded(session, "junior") == (2, 1.0)
+    assert index.least_loaded(session, "junior") == (1, 3.0)
+    assert session.calls == 2